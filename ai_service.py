@@ -1,51 +1,33 @@
 import os
 import json
+import time
+import asyncio
 import logging
-from openai import OpenAI
-from models import Program, UserProfile, Conversation
+from llm_client import LLMClient, CircuitOpenError
+from catalog import program_catalog, format_program_data
+from fallback_answers import build_fallback_answer
+from response_cache import ResponseCache
+from relevance import RelevanceClassifier
+from recommendations import classify_profile, recommendation_matrix
+from prompt_builder import PromptBuilder, count_tokens, fit_history, truncate_to_tokens
+from user_sessions import session_store
+from metrics import metrics, STAGE_SECONDS
+from models import UserProfile
 from app import db
 
 logger = logging.getLogger(__name__)
 
-class AIService:
-    def __init__(self):
-        # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-        # do not change this unless explicitly requested by the user
-        self.openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY", "your-openai-key"))
-        self.model = "gpt-4o"
+# Deadlines (seconds) for the model's answer: the whole completion, or the
+# first streamed token; past them the user gets a local fallback answer
+LLM_ANSWER_DEADLINE = float(os.environ.get("LLM_ANSWER_DEADLINE", "25"))
+LLM_FIRST_TOKEN_DEADLINE = float(os.environ.get("LLM_FIRST_TOKEN_DEADLINE", "10"))
+LLM_RECOMMENDATION_DEADLINE = float(os.environ.get("LLM_RECOMMENDATION_DEADLINE", "30"))
 
-    async def generate_response(self, user_message: str, user_id: str) -> str:
-        """Generate AI response for user message"""
-        try:
-            # Get or create user profile
-            user_profile = UserProfile.query.filter_by(telegram_user_id=str(user_id)).first()
-            if not user_profile:
-                user_profile = UserProfile()
-                user_profile.telegram_user_id = str(user_id)
-                user_profile.survey_step = 0
-                db.session.add(user_profile)
-                db.session.commit()
-            
-            # Handle survey process first
-            if user_profile.survey_step < 4:  # Survey not complete
-                return await self._handle_survey(user_message, user_profile)
-            
-            # Get program data from database
-            programs = Program.query.all()
-            program_data = self._format_program_data(programs)
-            
-            profile_context = self._format_user_profile(user_profile)
-            
-            # Get recent conversation history
-            recent_conversations = Conversation.query.filter_by(
-                telegram_user_id=str(user_id)
-            ).order_by(Conversation.created_at.desc()).limit(5).all()
-            
-            conversation_history = self._format_conversation_history(recent_conversations)
-            
-            # Check if question is relevant to ITMO AI programs
-            if not self._is_relevant_question(user_message):
-                return """
+ERROR_MESSAGE = "Извините, произошла ошибка. Попробуйте позже или задайте вопрос по-другому."
+TIMEOUT_MESSAGE = "Извините, ответ занимает слишком много времени. Попробуйте еще раз чуть позже."
+EMPTY_RESPONSE_MESSAGE = "Извините, произошла ошибка при генерации ответа."
+
+OFF_TOPIC_MESSAGE = """
 🤔 Я специализируюсь на вопросах о магистерских программах ИТМО в области искусственного интеллекта:
 
 • Искусственный интеллект  
@@ -53,55 +35,201 @@ class AIService:
 
 Пожалуйста, задайте вопрос об этих программах, их содержании, поступлении или карьерных перспективах.
                 """
-            
-            system_prompt = f"""
-Вы - помощник по выбору магистерских программ ИТМО в области искусственного интеллекта. 
-Отвечайте только на вопросы, связанные с двумя программами:
-1. "Искусственный интеллект" 
-2. "Управление ИИ-продуктами/AI Product"
+# First line of the off-topic reply; the LLM starts its own refusals with it too
+OFF_TOPIC_MARKER = OFF_TOPIC_MESSAGE.strip().split("\n")[0]
+# Starts of survey replies; the relevance classifier does not learn from them
+SURVEY_REPLY_MARKERS = ("👋 Привет!", "💼 **Вопрос", "🎯 **Вопрос", "✅ **Спасибо за ответы!")
 
-ДАННЫЕ О ПРОГРАММАХ:
-{program_data}
+PROFILE_TOKEN_BUDGET = 200
+USER_MESSAGE_TOKEN_BUDGET = 500
+
+RECOMMENDATIONS = metrics.counter(
+    "survey_recommendations_total", "Survey recommendations by source (matrix, llm or fallback)"
+)
 
-ПРОФИЛЬ ПОЛЬЗОВАТЕЛЯ:
-{profile_context}
 
-ИСТОРИЯ РАЗГОВОРА:
-{conversation_history}
+class PreparedResponse:
+    """Either a ready answer (text) or chat messages to send to the LLM"""
 
-ПРАВИЛА:
+    def __init__(self, text: str = None, messages: list = None, cache_key=None,
+                 estimated_prompt_tokens: int = None, question: str = None):
+        self.text = text
+        self.messages = messages
+        self.cache_key = cache_key
+        self.estimated_prompt_tokens = estimated_prompt_tokens
+        # The user's message, for a local fallback answer if the LLM call fails
+        self.question = question
+
+
+class AIService:
+    def __init__(self):
+        # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
+        # do not change this unless explicitly requested by the user
+        self.llm = LLMClient()
+        self.model = "gpt-4o"
+        self.response_cache = ResponseCache()
+        self.relevance = RelevanceClassifier(
+            off_topic_marker=OFF_TOPIC_MARKER,
+            gated_reply=OFF_TOPIC_MESSAGE,
+            ignored_markers=SURVEY_REPLY_MARKERS
+        )
+
+    async def prepare_response(self, user_message: str, user_id: str) -> PreparedResponse:
+        """Answer locally if possible, otherwise build the LLM request"""
+        # Get or create user session (cached profile and recent turns)
+        session = session_store.get(user_id)
+        user_profile = session.profile
+        
+        # Handle survey process first
+        if user_profile.survey_step < 4:  # Survey not complete
+            return PreparedResponse(text=await self._handle_survey(user_message, user_profile))
+        
+        # Check if question is relevant to ITMO AI programs
+        with STAGE_SECONDS.time(stage='relevance'):
+            relevant = self._is_relevant_question(user_message)
+        if not relevant:
+            return PreparedResponse(text=OFF_TOPIC_MESSAGE)
+        
+        # Structured program fields plus only the page fragments relevant to the question
+        with STAGE_SECONDS.time(stage='retrieval'):
+            catalog = program_catalog.get()
+            program_data = catalog.summary_text
+            relevant_fragments = catalog.retrieval_index.format_context(user_message)
+        
+        # Repeated questions are answered from the cache
+        cache_key = self.response_cache.make_key(user_message, catalog.version, user_profile.background)
+        cached_response = self.response_cache.get(cache_key)
+        if cached_response:
+            return PreparedResponse(text=cached_response)
+        
+        started = time.perf_counter()
+        # While OpenAI is degraded answer at once from the structured program data
+        if not self.llm.breaker.allow():
+            return PreparedResponse(text=self._fallback_answer(user_message, "circuit_open") or ERROR_MESSAGE)
+        
+        profile_context = self._format_user_profile(user_profile)
+        
+        # Older answers are truncated or dropped first when the prompt is too long
+        conversation_history = self._format_conversation_history(fit_history(session.recent_turns))
+        
+        prompt = PromptBuilder()
+        prompt.add("", """
+Вы - помощник по выбору магистерских программ ИТМО в области искусственного интеллекта. 
+Отвечайте только на вопросы, связанные с двумя программами:
+1. "Искусственный интеллект" 
+2. "Управление ИИ-продуктами/AI Product"
+        """)
+        prompt.add("ДАННЫЕ О ПРОГРАММАХ", program_data, shrink_order=3)
+        prompt.add("ФРАГМЕНТЫ СО СТРАНИЦ ПРОГРАММ", relevant_fragments, shrink_order=2)
+        prompt.add("ПРОФИЛЬ ПОЛЬЗОВАТЕЛЯ", profile_context, budget=PROFILE_TOKEN_BUDGET)
+        prompt.add("ИСТОРИЯ РАЗГОВОРА", conversation_history, shrink_order=1)
+        prompt.add("ПРАВИЛА", f"""
 - Отвечайте только на русском языке
 - Используйте только информацию из предоставленных данных о программах
 - Если информации нет в данных, честно скажите об этом
 - Давайте персональные рекомендации на основе профиля пользователя
 - Будьте дружелюбны и полезны
-- Если вопрос не связан с этими программами, вежливо перенаправьте
-            """
+- Если вопрос не связан с этими программами, начните ответ со строки "{OFF_TOPIC_MARKER}" и вежливо перенаправьте
+        """)
+        system_prompt = prompt.build()
+        logger.debug(f"Prompt tokens by section: {prompt.token_breakdown()}")
+        
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": truncate_to_tokens(user_message, USER_MESSAGE_TOKEN_BUDGET)}
+        ]
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage='prompt_build')
+        self._release_db_connection()
+        return PreparedResponse(
+            messages=messages,
+            cache_key=cache_key,
+            estimated_prompt_tokens=prompt.total_tokens() + count_tokens(messages[1]["content"]),
+            question=user_message
+        )
+
+    async def generate_response(self, user_message: str, user_id: str) -> str:
+        """Generate AI response for user message"""
+        try:
+            prepared = await self.prepare_response(user_message, user_id)
+            if prepared.text is not None:
+                return prepared.text
+            
+            with STAGE_SECONDS.time(stage='llm'):
+                response = await self.llm.complete(
+                    timeout=LLM_ANSWER_DEADLINE,
+                    purpose="answer",
+                    estimated_prompt_tokens=prepared.estimated_prompt_tokens,
+                    model=self.model,
+                    messages=prepared.messages,
+                    temperature=0.7,
+                    max_tokens=1500
+                )
+            
+            answer = response.choices[0].message.content
+            if not answer:
+                return EMPTY_RESPONSE_MESSAGE
+            
+            self.response_cache.set(prepared.cache_key, answer)
+            return answer
             
-            response = self.openai_client.chat.completions.create(
+        except CircuitOpenError:
+            return self._fallback_answer(user_message, "circuit_open") or ERROR_MESSAGE
+        except asyncio.TimeoutError:
+            logger.error(f"Timed out generating AI response for user {user_id}")
+            return self._fallback_answer(user_message, "timeout") or TIMEOUT_MESSAGE
+        except Exception as e:
+            logger.error(f"Error generating AI response: {e}")
+            return self._fallback_answer(user_message, "error") or ERROR_MESSAGE
+
+    async def stream_response(self, prepared: PreparedResponse):
+        """Yield the answer for a prepared LLM request as text deltas"""
+        answer = ""
+        started = time.perf_counter()
+        try:
+            async for delta in self.llm.stream(
+                timeout=LLM_ANSWER_DEADLINE,
+                first_token_timeout=LLM_FIRST_TOKEN_DEADLINE,
+                purpose="answer",
+                estimated_prompt_tokens=prepared.estimated_prompt_tokens,
                 model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_message}
-                ],
+                messages=prepared.messages,
                 temperature=0.7,
                 max_tokens=1500
-            )
+            ):
+                if not answer:
+                    STAGE_SECONDS.observe(time.perf_counter() - started, stage='llm_first_token')
+                answer += delta
+                yield delta
+            
+            if not answer:
+                yield EMPTY_RESPONSE_MESSAGE
+                return
             
-            return response.choices[0].message.content or "Извините, произошла ошибка при генерации ответа."
+            self.response_cache.set(prepared.cache_key, answer)
             
+        except CircuitOpenError:
+            yield self._fallback_answer(prepared.question, "circuit_open") or ERROR_MESSAGE
+        except asyncio.TimeoutError:
+            logger.error("Timed out streaming AI response")
+            if answer:
+                yield "\n\n" + TIMEOUT_MESSAGE
+            else:
+                yield self._fallback_answer(prepared.question, "timeout") or TIMEOUT_MESSAGE
         except Exception as e:
-            logger.error(f"Error generating AI response: {e}")
-            return "Извините, произошла ошибка. Попробуйте позже или задайте вопрос по-другому."
+            logger.error(f"Error streaming AI response: {e}")
+            if answer:
+                yield "\n\n" + ERROR_MESSAGE
+            else:
+                yield self._fallback_answer(prepared.question, "error") or ERROR_MESSAGE
 
     async def _handle_survey(self, user_message: str, user_profile: UserProfile) -> str:
         """Handle sequential survey to collect user background"""
         try:
             step = user_profile.survey_step
+            user_id = user_profile.telegram_user_id
             
             if step == 0:  # Welcome message
-                user_profile.survey_step = 1
-                db.session.commit()
+                session_store.update_profile(user_id, survey_step=1)
                 return """
 👋 Привет! Я помощник по выбору магистерских программ ИТМО в области ИИ.
 
@@ -113,9 +241,7 @@ class AIService:
                 """
             
             elif step == 1:  # Education background
-                user_profile.education_background = user_message
-                user_profile.survey_step = 2
-                db.session.commit()
+                session_store.update_profile(user_id, education_background=user_message, survey_step=2)
                 return """
 💼 **Вопрос 2 из 4:** Расскажите о своем опыте работы. Сколько лет вы работаете и в какой сфере?
 
@@ -123,9 +249,7 @@ class AIService:
                 """
             
             elif step == 2:  # Work experience  
-                user_profile.work_experience = user_message
-                user_profile.survey_step = 3
-                db.session.commit()
+                session_store.update_profile(user_id, work_experience=user_message, survey_step=3)
                 return """
 🎯 **Вопрос 3 из 4:** Какие у вас карьерные цели? Кем вы видите себя после окончания магистратуры?
 
@@ -133,9 +257,7 @@ class AIService:
                 """
             
             elif step == 3:  # Career goals
-                user_profile.career_goals = user_message
-                user_profile.survey_step = 4
-                db.session.commit()
+                session_store.update_profile(user_id, career_goals=user_message, survey_step=4)
                 
                 # Generate personalized recommendation
                 recommendation = await self._generate_recommendation(user_profile)
@@ -162,16 +284,43 @@ class AIService:
     async def _generate_recommendation(self, user_profile: UserProfile) -> str:
         """Generate personalized program recommendation based on user profile"""
         try:
-            programs = Program.query.all()
-            program_data = self._format_program_data(programs)
+            # Typical profiles are answered from the pre-generated matrix
+            bucket = classify_profile(
+                user_profile.education_background, user_profile.work_experience, user_profile.career_goals
+            )
+            if bucket:
+                recommendation = recommendation_matrix.get(bucket, program_catalog.get().version)
+                if recommendation:
+                    logger.info(f"Serving pre-generated recommendation for bucket {bucket}")
+                    RECOMMENDATIONS.inc(source='matrix')
+                    return recommendation
+            
+            recommendation = await self.request_recommendation(
+                user_profile.education_background, user_profile.work_experience, user_profile.career_goals
+            )
+            RECOMMENDATIONS.inc(source='llm')
+            return recommendation or "Не удалось сгенерировать рекомендацию."
             
-            system_prompt = f"""
+        except Exception as e:
+            logger.error(f"Error generating recommendation: {e}")
+            RECOMMENDATIONS.inc(source='fallback')
+            return "📊 На основе вашего профиля я рекомендую изучить подробнее обе программы и задать конкретные вопросы о содержании курсов."
+
+    async def request_recommendation(self, education_background: str, work_experience: str,
+                                     career_goals: str, batch: bool = False) -> str:
+        """Ask the model for a recommendation; errors are left to the caller.
+
+        batch marks calls from the recommendation matrix job (see LLMClient.complete).
+        """
+        program_data = program_catalog.get().program_text
+        
+        system_prompt = f"""
 Вы эксперт по образовательным программам ИТМО. На основе профиля пользователя дайте персональную рекомендацию.
 
 ПРОФИЛЬ ПОЛЬЗОВАТЕЛЯ:
-- Образование: {user_profile.education_background}
-- Опыт работы: {user_profile.work_experience}
-- Карьерные цели: {user_profile.career_goals}
+- Образование: {education_background}
+- Опыт работы: {work_experience}
+- Карьерные цели: {career_goals}
 
 ДОСТУПНЫЕ ПРОГРАММЫ:
 {program_data}
@@ -182,43 +331,38 @@ class AIService:
 3. Какие навыки стоит развивать
 
 Отвечайте только на русском языке, будьте конкретны и полезны.
-            """
-            
-            response = self.openai_client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": system_prompt}],
-                temperature=0.7,
-                max_tokens=500
-            )
-            
-            return response.choices[0].message.content or "Не удалось сгенерировать рекомендацию."
-            
+        """
+        
+        self._release_db_connection()
+        response = await self.llm.complete(
+            timeout=LLM_RECOMMENDATION_DEADLINE,
+            purpose="recommendation",
+            batch=batch,
+            model=self.model,
+            messages=[{"role": "user", "content": system_prompt}],
+            temperature=0.7,
+            max_tokens=500
+        )
+        
+        return response.choices[0].message.content
+
+    @staticmethod
+    def _release_db_connection():
+        """End the open read transaction so that no pooled connection is held
+        while this coroutine waits for the LLM"""
+        db.session.commit()
+
+    def _fallback_answer(self, user_message: str, reason: str) -> str:
+        """Local answer from the Program columns; None if even that is unavailable"""
+        try:
+            return build_fallback_answer(user_message or "", program_catalog.get().programs, reason)
         except Exception as e:
-            logger.error(f"Error generating recommendation: {e}")
-            return "📊 На основе вашего профиля я рекомендую изучить подробнее обе программы и задать конкретные вопросы о содержании курсов."
+            logger.error(f"Error building fallback answer: {e}")
+            return None
 
     def _format_program_data(self, programs) -> str:
         """Format program data for AI context"""
-        if not programs:
-            return "Данные о программах не загружены."
-        
-        formatted_data = ""
-        for program in programs:
-            formatted_data += f"""
-ПРОГРАММА: {program.name}
-URL: {program.url}
-Описание: {program.description or 'Не указано'}
-Длительность: {program.duration or 'Не указана'}
-Язык: {program.language or 'Не указан'}
-Стоимость: {program.cost or 'Не указана'}
-Бюджетных мест: {program.budget_places or 0}
-Контрактных мест: {program.contract_places or 0}
-Карьерные перспективы: {program.career_prospects or 'Не указаны'}
-Требования к поступлению: {program.admission_requirements or 'Не указаны'}
-
----
-            """
-        return formatted_data
+        return format_program_data(programs)
 
     def _format_user_profile(self, profile: UserProfile) -> str:
         """Format user profile for AI context"""
@@ -242,20 +386,9 @@ URL: {program.url}
 
     def _is_relevant_question(self, message: str) -> bool:
         """Check if the question is relevant to ITMO AI programs"""
-        message_lower = message.lower()
-        
-        # Keywords related to ITMO AI programs
-        relevant_keywords = [
-            'итмо', 'itmo', 'магистр', 'программа', 'искусственный интеллект', 'ai product',
-            'машинное обучение', 'ml', 'ai', 'поступление', 'экзамен', 'бюджет',
-            'контракт', 'карьера', 'работа', 'курс', 'дисциплина', 'проект',
-            'партнер', 'стоимость', 'длительность', 'требования', 'диплом'
-        ]
-        
-        # Check if message contains relevant keywords
-        return any(keyword in message_lower for keyword in relevant_keywords)
+        return self.relevance.is_relevant(message)
 
-    def analyze_student_fit(self, user_profile: UserProfile) -> dict:
+    async def analyze_student_fit(self, user_profile: UserProfile) -> dict:
         """Analyze which program fits better for the student"""
         try:
             profile_text = f"""
@@ -278,7 +411,10 @@ URL: {program.url}
 }
             """
             
-            response = self.openai_client.chat.completions.create(
+            self._release_db_connection()
+            response = await self.llm.complete(
+                timeout=LLM_RECOMMENDATION_DEADLINE,
+                purpose="student_fit",
                 model=self.model,
                 messages=[
                     {"role": "system", "content": system_prompt},
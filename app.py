@@ -31,4 +31,8 @@ with app.app_context():
     import models  # noqa: F401
     db.create_all()
     
+    # Add indexes introduced after the tables were first created
+    from db_migrations import upgrade_schema
+    upgrade_schema()
+    
     # Routes will be imported when main.py is loaded
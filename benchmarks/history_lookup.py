@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark the per-turn conversation history lookup as the table grows.
+
+Seeds a throwaway SQLite database with synthetic conversations and times
+the query AIService runs on every turn (last 5 messages of one user),
+with and without the (telegram_user_id, created_at) index.
+
+    python benchmarks/history_lookup.py --sizes 10000 100000 1000000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+DB_PATH = os.path.join(tempfile.gettempdir(), "itmo_bot_history_bench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db
+from models import Conversation
+
+INDEX_NAME = 'ix_conversation_user_created'
+
+def seed(total_rows: int, users: int, batch_size: int = 50000):
+    """Append synthetic conversations until the table has total_rows rows"""
+    existing = Conversation.query.count()
+    start = datetime.utcnow() - timedelta(days=365)
+    for offset in range(existing, total_rows, batch_size):
+        rows = [
+            {
+                'telegram_user_id': str(random.randrange(users)),
+                'username': 'bench',
+                'message': 'Сколько стоит обучение?',
+                'response': 'Стоимость обучения составляет 599 000 ₽ в год.',
+                'created_at': start + timedelta(seconds=i)
+            }
+            for i in range(offset, min(offset + batch_size, total_rows))
+        ]
+        db.session.execute(db.insert(Conversation), rows)
+        db.session.commit()
+
+def time_lookup(users: int, repeats: int) -> float:
+    """Average milliseconds for the per-turn history query"""
+    user_ids = [str(random.randrange(users)) for _ in range(repeats)]
+    started = time.perf_counter()
+    for user_id in user_ids:
+        Conversation.query.filter_by(
+            telegram_user_id=user_id
+        ).order_by(Conversation.created_at.desc()).limit(5).all()
+        db.session.expunge_all()
+    return (time.perf_counter() - started) / repeats * 1000
+
+def set_index(enabled: bool):
+    index = next(index for index in Conversation.__table__.indexes if index.name == INDEX_NAME)
+    if enabled:
+        index.create(bind=db.engine, checkfirst=True)
+    else:
+        index.drop(bind=db.engine, checkfirst=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--repeats', type=int, default=200)
+    parser.add_argument('--no-compare', action='store_true', help="skip the run without the index")
+    args = parser.parse_args()
+    
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        
+        print(f"{'rows':>10} {'indexed, ms':>12} {'no index, ms':>13}")
+        for size in sorted(args.sizes):
+            seed(size, args.users)
+            set_index(True)
+            indexed = time_lookup(args.users, args.repeats)
+            unindexed = None
+            if not args.no_compare:
+                set_index(False)
+                unindexed = time_lookup(args.users, max(args.repeats // 20, 3))
+                set_index(True)
+            print(f"{size:>10} {indexed:>12.3f} {unindexed if unindexed is not None else float('nan'):>13.3f}")
+        
+        db.drop_all()
+    os.remove(DB_PATH)
+
+if __name__ == "__main__":
+    main()
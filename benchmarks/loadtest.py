@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test of the bot's update handlers.
+
+Drives the real ITMOBot handlers with synthetic updates from many simulated
+users. Updates are put on the python-telegram-bot Application's update
+queue, as the webhook server does, so they pass through the same update
+processor (BOT_CONCURRENT_UPDATES, per-user ordering) as in production.
+Latency is measured from enqueueing an update until its handlers have
+finished. Telegram and OpenAI are
+replaced by the local stubs from fake_telegram.py and fake_openai.py, which
+run in a separate process; the database is a throwaway SQLite file seeded
+with the program page fixtures.
+
+Scenarios:
+    survey     /start, the survey button and the four survey answers
+    buttons    keyboard buttons and a /profile-style update
+    questions  free questions about the programs (and one off-topic)
+
+For every scenario it reports throughput, p50/p95/p99 handler latency, SQL
+statements per update (in the handlers and in background writers), Bot API
+calls, LLM requests and messages shed by the rate limit or admission queue
+(RATE_LIMIT_* and ADMISSION_* from the environment apply).
+
+    python benchmarks/loadtest.py --users 1000 --concurrency 200 --llm-latency 0.8 --token-delay 0.01
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import logging
+import argparse
+import tempfile
+import contextvars
+import multiprocessing
+from urllib.request import urlopen
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DB_PATH = os.path.join(tempfile.gettempdir(), "itmo_bot_loadtest.db")
+FIXTURES_DIR = os.path.join(ROOT, "benchmarks", "fixtures")
+
+EDUCATION_ANSWERS = [
+    "Бакалавр информатики", "Прикладная математика", "Экономист", "Инженер-программист",
+    "Физик", "Филолог", "Бизнес-информатика", "Музыкальное училище"
+]
+WORK_ANSWERS = [
+    "3 года разработчиком Python", "1 год аналитиком данных", "только начинаю карьеру",
+    "5 лет в маркетинге", "полгода стажером", "не работал"
+]
+GOAL_ANSWERS = [
+    "ML-инженер", "продакт-менеджер ИИ-продуктов", "исследователь", "data scientist",
+    "хочу открыть свой стартап", "пока не знаю"
+]
+QUESTIONS = [
+    "Сколько стоит обучение?", "Какие предметы изучают на первом курсе?",
+    "Сколько бюджетных мест на программе?", "Чем отличаются две программы?",
+    "Какие есть карьерные перспективы после выпуска?", "Как поступить без олимпиады?",
+    "Можно ли совмещать учебу с работой?", "Кто партнеры программы?",
+    "Какие экзамены нужно сдавать?", "Есть ли общежитие для иногородних?"
+]
+OFF_TOPIC = ["Какая погода будет завтра?", "Расскажи анекдот", "Посоветуй фильм на вечер"]
+BUTTONS = ["📊 Сравнить программы", "👤 Мой профиль", "❓ Задать вопрос"]
+
+SCENARIOS = {
+    'survey': lambda rng, unique: [
+        "/start", "📝 Начать опрос", rng.choice(EDUCATION_ANSWERS), rng.choice(WORK_ANSWERS), rng.choice(GOAL_ANSWERS)
+    ],
+    'buttons': lambda rng, unique: BUTTONS + ["technical, 3, машинное обучение, стартапы"],
+    'questions': lambda rng, unique: [
+        question + (f" (вариант {rng.randrange(10 ** 6)})" if unique else "")
+        for question in rng.sample(QUESTIONS, 3)
+    ] + [rng.choice(OFF_TOPIC)],
+}
+# Scenarios whose users already finished the survey
+SEEDED_SCENARIOS = ('buttons', 'questions')
+
+_scenario = contextvars.ContextVar('scenario', default='background')
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def run_stubs(api_port: int, llm_port: int, args):
+    """Serve the fake Bot API and the fake OpenAI API (child process)"""
+    from aiohttp import web
+    from fake_telegram import FakeBotAPI
+    from fake_openai import FakeOpenAI
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    async def serve():
+        stubs = (
+            (FakeBotAPI(args.bot_latency).create_app(), api_port),
+            (FakeOpenAI(args.llm_latency, args.token_delay, args.answer_tokens).create_app(), llm_port)
+        )
+        for stub_app, port in stubs:
+            runner = web.AppRunner(stub_app, access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, '127.0.0.1', port).start()
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+def wait_for_port(port: int, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"stub on port {port} did not start")
+
+def fetch_stats(port: int) -> dict:
+    with urlopen(f"http://127.0.0.1:{port}/_stats") as response:
+        return json.load(response)
+
+def configure_environment(api_port: int, llm_port: int, args):
+    """Point the bot at the stubs; must run before the bot modules are imported"""
+    if os.path.exists(DB_PATH):
+        os.remove(DB_PATH)
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{DB_PATH}",
+        'TELEGRAM_BOT_TOKEN': "123456:LOADTEST",
+        'TELEGRAM_API_BASE_URL': f"http://127.0.0.1:{api_port}",
+        'OPENAI_BASE_URL': f"http://127.0.0.1:{llm_port}/v1",
+        'OPENAI_API_KEY': "loadtest",
+        'STREAM_RESPONSES': "0" if args.no_stream else "1",
+        'STREAM_EDIT_INTERVAL': str(args.edit_interval),
+    })
+    if args.bot_concurrency:
+        os.environ['BOT_CONCURRENT_UPDATES'] = str(args.bot_concurrency)
+
+def seed_database(seeded_users: list):
+    """Programs from the page fixtures and finished-survey profiles"""
+    from app import db
+    from models import Program, UserProfile
+    from page_store import store_snapshot
+    from retrieval import chunk_text
+    from web_scraper import load_program_list, parse_program_data
+
+    for program_info in load_program_list():
+        fixture = os.path.join(FIXTURES_DIR, program_info['url'].rstrip('/').rsplit('/', 1)[-1] + ".txt")
+        if not os.path.exists(fixture):
+            continue
+        with open(fixture, encoding='utf-8') as f:
+            content = f.read()
+        program = Program(name=program_info['name'], url=program_info['url'], **parse_program_data(content, program_info['url']))
+        db.session.add(program)
+        db.session.flush()
+        program.curriculum_data = {
+            'fetch_state': {},
+            'content_hash': store_snapshot(program.id, program.url, content, chunk_text(content))
+        }
+
+    if not seeded_users:
+        db.session.commit()
+        return
+    db.session.execute(db.insert(UserProfile), [
+        {
+            'telegram_user_id': str(user_id),
+            'username': f"user{user_id}",
+            'survey_step': 4,
+            'preferred_language': 'ru',
+            'education_background': EDUCATION_ANSWERS[user_id % len(EDUCATION_ANSWERS)],
+            'work_experience': WORK_ANSWERS[user_id % len(WORK_ANSWERS)],
+            'career_goals': GOAL_ANSWERS[user_id % len(GOAL_ANSWERS)]
+        }
+        for user_id in seeded_users
+    ])
+    db.session.commit()
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+class UpdateTracker:
+    """Signals when the application has finished handling an enqueued update"""
+
+    def __init__(self):
+        self.errors = 0
+        self._pending = {}
+
+    def install(self, application):
+        from telegram import Update
+        from telegram.ext import TypeHandler
+
+        # Group -1 runs before the bot's handlers and group 1 after them, also when they raised
+        application.add_handler(TypeHandler(Update, self._started), group=-1)
+        application.add_handler(TypeHandler(Update, self._finished), group=1)
+        application.add_error_handler(self._error)
+
+    def expect(self, update_id: int, scenario: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._pending[update_id] = (scenario, future)
+        return future
+
+    async def _started(self, update, context):
+        # Each update is handled in its own task, so this labels only its SQL statements
+        _scenario.set(self._pending[update.update_id][0])
+
+    async def _finished(self, update, context):
+        _, future = self._pending.pop(update.update_id)
+        future.set_result(None)
+
+    async def _error(self, update, context):
+        self.errors += 1
+
+async def run_scenario(application, tracker: UpdateTracker, name: str, user_ids: list, args,
+                       query_counts: dict) -> dict:
+    from telegram import Update
+    from fake_telegram import make_text_update
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    errors_before = tracker.errors
+
+    async def run_user(user_id: int):
+        rng = random.Random(user_id)
+        async with semaphore:
+            for text in SCENARIOS[name](rng, args.unique_questions):
+                update = Update.de_json(make_text_update(user_id, text), application.bot)
+                finished = tracker.expect(update.update_id, name)
+                started = time.perf_counter()
+                await application.update_queue.put(update)
+                await finished
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_user(user_id) for user_id in user_ids))
+    seconds = time.perf_counter() - started
+
+    return {
+        'scenario': name,
+        'users': len(user_ids),
+        'updates': len(latencies),
+        'errors': tracker.errors - errors_before,
+        'seconds': round(seconds, 3),
+        'updates_per_second': round(len(latencies) / seconds, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'queries_per_update': round(query_counts.get(name, 0) / max(len(latencies), 1), 2),
+    }
+
+async def run(args, api_port: int, llm_port: int) -> list:
+    from sqlalchemy import event
+    from app import app, db
+    from conversation_log import conversation_logger
+    from rate_limit import SHED
+    from telegram_bot import setup_bot
+
+    query_counts = {}
+
+    def count_query(*_):
+        label = _scenario.get()
+        query_counts[label] = query_counts.get(label, 0) + 1
+
+    scenario_names = args.scenarios
+    user_ranges = {
+        name: list(range(1000000 * (index + 1), 1000000 * (index + 1) + args.users))
+        for index, name in enumerate(scenario_names)
+    }
+
+    with app.app_context():
+        seed_database([user_id for name in scenario_names if name in SEEDED_SCENARIOS for user_id in user_ranges[name]])
+        event.listen(db.engine, "before_cursor_execute", count_query)
+        if args.recommendation_matrix:
+            from recommendations import build_recommendation_matrix
+            await build_recommendation_matrix()
+        application = setup_bot(webhook=True)
+    tracker = UpdateTracker()
+    tracker.install(application)
+
+    results = []
+    loop = asyncio.get_running_loop()
+    async with application:
+        await application.start()
+        for name in scenario_names:
+            bot_calls_before = sum(fetch_stats(api_port).values())
+            llm_before = fetch_stats(llm_port)['requests']
+            background_before = query_counts.get('background', 0)
+            shed_before = sum(SHED.values.values())
+
+            result = await run_scenario(application, tracker, name, user_ranges[name], args, query_counts)
+
+            # Let the conversation log writer flush this scenario's rows
+            await loop.run_in_executor(None, conversation_logger.stop)
+            result['background_queries_per_update'] = round(
+                (query_counts.get('background', 0) - background_before) / max(result['updates'], 1), 2
+            )
+            result['bot_api_calls'] = sum(fetch_stats(api_port).values()) - bot_calls_before
+            result['llm_requests'] = fetch_stats(llm_port)['requests'] - llm_before
+            result['shed'] = sum(SHED.values.values()) - shed_before
+            results.append(result)
+        await application.stop()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200, help='simulated users per scenario')
+    parser.add_argument('--concurrency', type=int, default=100, help='users active at the same time')
+    parser.add_argument('--bot-concurrency', type=int, help='BOT_CONCURRENT_UPDATES for the bot (default: its own)')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--llm-latency', type=float, default=0.5, help='fake OpenAI time to first token, seconds')
+    parser.add_argument('--token-delay', type=float, default=0.01, help='fake OpenAI delay per streamed token')
+    parser.add_argument('--answer-tokens', type=int, default=100)
+    parser.add_argument('--bot-latency', type=float, default=0.0, help='fake Bot API delay per call')
+    parser.add_argument('--edit-interval', type=float, default=0.5, help='STREAM_EDIT_INTERVAL for the bot')
+    parser.add_argument('--no-stream', action='store_true', help='reply with complete answers (STREAM_RESPONSES=0)')
+    parser.add_argument('--unique-questions', action='store_true', help='make every question unique to defeat caches')
+    parser.add_argument('--recommendation-matrix', action='store_true', help='pre-generate survey recommendations first')
+    parser.add_argument('--json', help='also write results to this file')
+    args = parser.parse_args()
+
+    api_port, llm_port = free_port(), free_port()
+    stubs = multiprocessing.Process(target=run_stubs, args=(api_port, llm_port, args), daemon=True)
+    stubs.start()
+    try:
+        wait_for_port(api_port)
+        wait_for_port(llm_port)
+        configure_environment(api_port, llm_port, args)
+        logging.basicConfig(level=logging.WARNING)
+        results = asyncio.run(run(args, api_port, llm_port))
+    finally:
+        stubs.terminate()
+        if os.path.exists(DB_PATH):
+            os.remove(DB_PATH)
+
+    columns = ('scenario', 'users', 'updates', 'errors', 'updates_per_second', 'p50_ms', 'p95_ms', 'p99_ms',
+               'queries_per_update', 'background_queries_per_update', 'bot_api_calls', 'llm_requests', 'shed')
+    headers = ('scenario', 'users', 'updates', 'errors', 'upd/s', 'p50 ms', 'p95 ms', 'p99 ms',
+               'sql/upd', 'bg sql/upd', 'bot api', 'llm', 'shed')
+    print(" ".join(f"{header:>10}" for header in headers))
+    for result in results:
+        print(" ".join(f"{result[column]:>10}" for column in columns))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'results': results}, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the bot's hot paths, with JSON baselines.
+
+Times page parsing on the fixtures, prompt formatting, the relevance check,
+queuing a conversation for the log writer and the /api/stats and
+/api/programs handlers against a throwaway SQLite database of realistic
+size. Results can be saved as a named baseline and later runs compared
+against it; the comparison exits with status 1 if any benchmark got slower
+than the allowed ratio.
+
+    python benchmarks/microbench.py --save before
+    python benchmarks/microbench.py --compare before --threshold 1.25
+    python benchmarks/microbench.py --only relevance api_stats
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+DB_PATH = os.path.join(tempfile.gettempdir(), "itmo_bot_microbench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ.setdefault("OPENAI_API_KEY", "microbench")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import logging
+logging.disable(logging.WARNING)
+
+from app import app, db
+from models import Conversation, UserProfile, Program
+from catalog import program_catalog
+from page_store import store_snapshot
+from retrieval import chunk_text
+from web_scraper import load_program_list, parse_program_data
+
+BASELINES_DIR = os.path.join(ROOT, "benchmarks", "baselines")
+FIXTURES_DIR = os.path.join(ROOT, "benchmarks", "fixtures")
+
+MESSAGES = [
+    "Сколько стоит обучение?", "Какие предметы на первом курсе?", "Какая погода будет завтра?",
+    "Можно ли совмещать учебу с работой?", "Расскажи анекдот", "He said it was fine",
+    "Где проходят занятия?", "Кто выиграл вчерашний матч?"
+]
+BACKGROUNDS = ['technical', 'product', 'mixed', 'beginner', None]
+
+def load_fixtures() -> dict:
+    fixtures = {}
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        if name.endswith(".txt"):
+            with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+                fixtures[name[:-4]] = f.read()
+    return fixtures
+
+def seed(conversations: int, users: int, fixtures: dict, batch_size: int = 50000):
+    """Programs from the fixtures, user profiles and a year of conversations"""
+    db.drop_all()
+    db.create_all()
+    for program_info in load_program_list():
+        content = fixtures.get(program_info['url'].rstrip('/').rsplit('/', 1)[-1])
+        if content is None:
+            continue
+        program = Program(name=program_info['name'], url=program_info['url'], **parse_program_data(content, program_info['url']))
+        db.session.add(program)
+        db.session.flush()
+        program.curriculum_data = {
+            'fetch_state': {},
+            'content_hash': store_snapshot(program.id, program.url, content, chunk_text(content))
+        }
+    db.session.execute(db.insert(UserProfile), [
+        {'telegram_user_id': str(i), 'survey_step': 4, 'background': BACKGROUNDS[i % len(BACKGROUNDS)]}
+        for i in range(users)
+    ])
+    start = datetime.utcnow() - timedelta(days=365)
+    step = 365 * 24 * 3600 / max(conversations, 1)
+    for offset in range(0, conversations, batch_size):
+        db.session.execute(db.insert(Conversation), [
+            {
+                'telegram_user_id': str(random.randrange(users)),
+                'message': random.choice(MESSAGES),
+                'response': 'Стоимость обучения составляет 599 000 ₽ в год.',
+                'created_at': start + timedelta(seconds=i * step)
+            }
+            for i in range(offset, min(offset + batch_size, conversations))
+        ])
+    db.session.commit()
+
+def measure(func, min_time: float, repeats: int) -> dict:
+    """Per-call time in microseconds: loops are calibrated to run at least min_time"""
+    # Lazy initialisation (catalog load, first queries) is not what we time
+    func()
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or loops >= 10 ** 6:
+            break
+        loops *= 10 if elapsed < min_time / 10 else 2
+
+    timings = [elapsed / loops]
+    for _ in range(repeats - 1):
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        timings.append((time.perf_counter() - started) / loops)
+    return {
+        'median_us': round(statistics.median(timings) * 1e6, 3),
+        'min_us': round(min(timings) * 1e6, 3),
+        'loops': loops,
+        'repeats': repeats
+    }
+
+def build_benchmarks(fixtures: dict) -> tuple:
+    """(name -> zero-argument callable, name -> teardown run after that benchmark);
+    must be called inside an app context"""
+    import routes  # noqa: F401
+    import telegram_bot
+    from types import SimpleNamespace
+    from conversation_log import ConversationLogger
+
+    bot = telegram_bot.ITMOBot()
+    ai_service = bot.ai_service
+    # Train now, so no background training competes with the timed calls
+    ai_service.relevance.train_from_history()
+    programs = program_catalog.get().programs
+    turns = [
+        SimpleNamespace(message=random.choice(MESSAGES), response="Ответ бота про программу. " * 20)
+        for _ in range(5)
+    ]
+    client = app.test_client()
+    messages = iter(MESSAGES * 10 ** 6)
+
+    # An unbounded queue, so every call is an enqueue rather than the queue-full drop path
+    bench_logger = ConversationLogger(max_queue=0)
+    app_logger = telegram_bot.conversation_logger
+
+    def save_conversation():
+        telegram_bot.conversation_logger = bench_logger
+        bot._save_conversation("42", "bench", "Сколько стоит обучение?", "599 000 ₽ в год")
+
+    def save_conversation_teardown():
+        # Write out the queued rows now, so the writer does not load SQLite during later benchmarks
+        telegram_bot.conversation_logger = app_logger
+        bench_logger.stop(timeout=300)
+
+    def api_stats():
+        # Time the queries, not the 60 s payload cache
+        routes._stats_cache.clear()
+        client.get('/api/stats?days=30')
+
+    def api_programs_cold():
+        program_catalog.invalidate()
+        client.get('/api/programs')
+
+    benchmarks = {
+        f'parse_program_data[{name}]': (lambda content=content: parse_program_data(content, ""))
+        for name, content in fixtures.items()
+    }
+    benchmarks.update({
+        'format_program_data': lambda: ai_service._format_program_data(programs),
+        'format_conversation_history': lambda: ai_service._format_conversation_history(turns),
+        'relevance': lambda: ai_service._is_relevant_question(next(messages)),
+        'save_conversation': save_conversation,
+        'api_stats': api_stats,
+        'api_programs': lambda: client.get('/api/programs'),
+        'api_programs_cold': api_programs_cold,
+    })
+    return benchmarks, {'save_conversation': save_conversation_teardown}
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    """Print a comparison table; returns True if nothing regressed"""
+    ok = True
+    print(f"{'benchmark':<36} {'baseline, us':>13} {'current, us':>12} {'ratio':>7}")
+    for name, result in results.items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            print(f"{name:<36} {'-':>13} {result['median_us']:>12.2f} {'new':>7}")
+            continue
+        ratio = result['median_us'] / previous['median_us'] if previous['median_us'] else float('inf')
+        flag = "  REGRESSION" if ratio > threshold else ""
+        ok = ok and not flag
+        print(f"{name:<36} {previous['median_us']:>13.2f} {result['median_us']:>12.2f} {ratio:>6.2f}x{flag}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--conversations', type=int, default=100000, help='seeded Conversation rows')
+    parser.add_argument('--users', type=int, default=10000, help='seeded UserProfile rows')
+    parser.add_argument('--only', nargs='+', help='run benchmarks whose names start with these prefixes')
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimum seconds per measurement')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--save', metavar='NAME', help='store results as benchmarks/baselines/NAME.json')
+    parser.add_argument('--compare', metavar='NAME', help='compare with benchmarks/baselines/NAME.json')
+    parser.add_argument('--threshold', type=float, default=1.25, help='slowdown ratio reported as a regression')
+    args = parser.parse_args()
+
+    random.seed(0)
+    fixtures = load_fixtures()
+    results = {}
+    with app.app_context():
+        seed(args.conversations, args.users, fixtures)
+        benchmarks, teardowns = build_benchmarks(fixtures)
+        try:
+            for name, func in benchmarks.items():
+                if args.only and not any(name.startswith(prefix) for prefix in args.only):
+                    continue
+                try:
+                    results[name] = measure(func, args.min_time, args.repeats)
+                finally:
+                    if name in teardowns:
+                        teardowns.pop(name)()
+                if not args.compare:
+                    print(f"{name:<36} {results[name]['median_us']:>12.2f} us")
+        finally:
+            db.session.remove()
+            db.drop_all()
+    os.remove(DB_PATH)
+
+    report = {
+        'created_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'conversations': args.conversations,
+        'users': args.users,
+        'results': results
+    }
+    if args.save:
+        os.makedirs(BASELINES_DIR, exist_ok=True)
+        path = os.path.join(BASELINES_DIR, f"{args.save}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Saved baseline {path}")
+    if args.compare:
+        with open(os.path.join(BASELINES_DIR, f"{args.compare}.json"), encoding='utf-8') as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
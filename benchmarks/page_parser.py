@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark parse_program_data on saved program page text.
+
+Fixtures in benchmarks/fixtures/*.txt are page texts as returned by
+trafilatura. Each one is parsed by the current parser and by the previous
+regex-per-field implementation (kept below for comparison). --scale
+repeats the page body to see how both behave on longer pages.
+
+    python benchmarks/page_parser.py --repeats 2000 --scale 1 10
+"""
+import os
+import re
+import sys
+import glob
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from web_scraper import parse_program_data
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+def legacy_parse_program_data(content: str, url: str) -> dict:
+    """The parser before sections were split in one pass"""
+    data = {
+        'description': '', 'duration': '', 'language': '', 'cost': '',
+        'budget_places': 0, 'contract_places': 0, 'career_prospects': '',
+        'admission_requirements': '', 'partners': [], 'team_members': []
+    }
+    if 'длительность' in content.lower():
+        duration_match = re.search(r'длительность[:\s]*(\d+\s*год[а-я]*)', content, re.IGNORECASE)
+        if duration_match:
+            data['duration'] = duration_match.group(1)
+    if 'язык обучения' in content.lower():
+        lang_match = re.search(r'язык обучения[:\s]*([а-я]+)', content, re.IGNORECASE)
+        if lang_match:
+            data['language'] = lang_match.group(1)
+    cost_match = re.search(r'(\d+\s*\d+\s*₽)', content)
+    if cost_match:
+        data['cost'] = cost_match.group(1)
+    budget_match = re.search(r'(\d+)\s*бюджетных', content)
+    if budget_match:
+        data['budget_places'] = int(budget_match.group(1))
+    contract_match = re.search(r'(\d+)\s*контрактных', content)
+    if contract_match:
+        data['contract_places'] = int(contract_match.group(1))
+    desc_match = re.search(r'о программе.*?(?=партнеры программы|команда|учебный план)', content, re.IGNORECASE | re.DOTALL)
+    if desc_match:
+        data['description'] = desc_match.group(0).replace('о программе', '').strip()
+    career_match = re.search(r'карьера.*?(?=ты сможешь работать|партнеры|отзывы)', content, re.IGNORECASE | re.DOTALL)
+    if career_match:
+        data['career_prospects'] = career_match.group(0).replace('карьера', '').strip()
+    admission_match = re.search(r'как поступить.*?(?=$)', content, re.IGNORECASE | re.DOTALL)
+    if admission_match:
+        data['admission_requirements'] = admission_match.group(0).replace('как поступить', '').strip()
+    return data
+
+def load_fixtures() -> dict:
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.txt"))):
+        with open(path, encoding='utf-8') as f:
+            fixtures[os.path.splitext(os.path.basename(path))[0]] = f.read()
+    return fixtures
+
+def scale_page(content: str, scale: int) -> str:
+    """Repeat the page body scale times, keeping headings in place"""
+    if scale <= 1:
+        return content
+    lines = content.splitlines()
+    return "\n".join(line if len(line) < 60 else " ".join([line] * scale) for line in lines)
+
+def time_parser(parser, content: str, repeats: int) -> float:
+    """Average microseconds per call"""
+    started = time.perf_counter()
+    for _ in range(repeats):
+        parser(content, "")
+    return (time.perf_counter() - started) / repeats * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeats', type=int, default=1000)
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 10])
+    args = parser.parse_args()
+
+    fixtures = load_fixtures()
+    if not fixtures:
+        sys.exit(f"No fixtures in {FIXTURES_DIR}")
+
+    print(f"{'fixture':<14} {'scale':>5} {'chars':>8} {'legacy, us':>12} {'current, us':>12} {'speedup':>8}")
+    for name, content in fixtures.items():
+        for scale in args.scale:
+            page = scale_page(content, scale)
+            legacy = time_parser(legacy_parse_program_data, page, args.repeats)
+            current = time_parser(parse_program_data, page, args.repeats)
+            print(f"{name:<14} {scale:>5} {len(page):>8} {legacy:>12.1f} {current:>12.1f} {legacy / current:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
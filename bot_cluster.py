@@ -0,0 +1,139 @@
+import os
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing
+from telegram import Update
+from app import app, db
+
+logger = logging.getLogger(__name__)
+
+# Bot worker processes; 1 keeps the classic single-process bot
+BOT_WORKERS = int(os.environ.get("BOT_WORKERS", "1"))
+# Users processed concurrently inside one worker process
+BOT_WORKER_CONCURRENCY = int(os.environ.get("BOT_WORKER_CONCURRENCY", "32"))
+
+_STOP = None
+
+
+class ConsistentHashRing:
+    """Maps keys to nodes so that adding a node moves only ~1/N of the keys"""
+
+    def __init__(self, nodes: list, replicas: int = 100):
+        self._ring = sorted(
+            (self._hash(f"{node}:{i}"), node)
+            for node in nodes
+            for i in range(replicas)
+        )
+        self._hashes = [point for point, _ in self._ring]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int(hashlib.md5(key.encode()).hexdigest()[:16], 16)
+
+    def get_node(self, key: str):
+        index = bisect.bisect(self._hashes, self._hash(key)) % len(self._ring)
+        return self._ring[index][1]
+
+
+def update_user_id(update_data: dict) -> str:
+    """Extract the sender's Telegram id from raw update JSON"""
+    for value in update_data.values():
+        if isinstance(value, dict) and isinstance(value.get('from'), dict):
+            return str(value['from']['id'])
+    return str(update_data.get('update_id', 0))
+
+
+class BotCluster:
+    """Partitions updates by telegram_user_id across bot worker processes.
+
+    Each user always lands on the same worker, which handles that user's
+    updates strictly in order while processing other users concurrently.
+    Every worker has its own database engine and a separate session per
+    update instead of sharing one scoped session.
+    """
+
+    def __init__(self, workers: int = BOT_WORKERS):
+        self.workers = workers
+        self._queues = [multiprocessing.Queue() for _ in range(workers)]
+        self._processes = []
+        self._ring = ConsistentHashRing(list(range(workers)))
+
+    def start(self):
+        for index, queue in enumerate(self._queues):
+            process = multiprocessing.Process(
+                target=_worker_main, args=(index, queue), name=f"bot-worker-{index}", daemon=True
+            )
+            process.start()
+            self._processes.append(process)
+        logger.info(f"Started {self.workers} bot worker processes")
+
+    def dispatch(self, update_data: dict):
+        """Send raw update JSON to the worker that owns its user"""
+        self._queues[self._ring.get_node(update_user_id(update_data))].put(update_data)
+
+    def stop(self, timeout: float = 30):
+        for queue in self._queues:
+            queue.put(_STOP)
+        for process in self._processes:
+            process.join(timeout)
+
+
+def setup_forwarding_bot(cluster: BotCluster):
+    """Polling application that only forwards updates to the cluster"""
+    from telegram.ext import TypeHandler
+    from telegram_bot import build_application
+
+    async def forward(update: Update, context):
+        cluster.dispatch(update.to_dict())
+
+    application = build_application()
+    application.add_handler(TypeHandler(Update, forward))
+    return application
+
+
+def _worker_main(index: int, queue):
+    from telegram_bot import setup_bot
+    from conversation_log import conversation_logger
+
+    with app.app_context():
+        # Do not reuse pooled connections inherited from the parent process
+        db.engine.dispose(close=False)
+        application = setup_bot(webhook=True)
+    try:
+        asyncio.run(_consume(application, queue))
+    finally:
+        conversation_logger.stop()
+    logger.info(f"Bot worker {index} stopped")
+
+
+async def _consume(application, queue):
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(BOT_WORKER_CONCURRENCY)
+    # Last scheduled task per user; the next update for that user waits on it
+    tails = {}
+
+    async def process(user_id: str, update_data: dict, previous):
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        async with semaphore:
+            try:
+                # A fresh app context gives this update its own DB session
+                with app.app_context():
+                    await application.process_update(Update.de_json(update_data, application.bot))
+            except Exception as e:
+                logger.error(f"Error processing update for user {user_id}: {e}")
+        if tails.get(user_id) is asyncio.current_task():
+            del tails[user_id]
+
+    async with application:
+        while True:
+            update_data = await loop.run_in_executor(None, queue.get)
+            if update_data is _STOP:
+                break
+            user_id = update_user_id(update_data)
+            tails[user_id] = asyncio.create_task(process(user_id, update_data, tails.get(user_id)))
+
+        if tails:
+            await asyncio.gather(*tails.values(), return_exceptions=True)
@@ -0,0 +1,154 @@
+import os
+import time
+import logging
+import threading
+from types import SimpleNamespace
+from app import db
+from models import Program
+from retrieval import RetrievalIndex
+from page_store import load_chunks
+
+logger = logging.getLogger(__name__)
+
+# How often (seconds) to check whether another process changed the catalog
+CATALOG_RECHECK_INTERVAL = float(os.environ.get("CATALOG_RECHECK_INTERVAL", "60"))
+
+PROGRAM_FIELDS = (
+    'id', 'name', 'url', 'description', 'duration', 'language', 'cost',
+    'budget_places', 'contract_places', 'career_prospects',
+    'admission_requirements', 'partners', 'team_members', 'updated_at'
+)
+
+
+def format_program_data(programs) -> str:
+    """Format program data for AI context"""
+    if not programs:
+        return "Данные о программах не загружены."
+
+    formatted_data = ""
+    for program in programs:
+        formatted_data += f"""
+ПРОГРАММА: {program.name}
+URL: {program.url}
+Описание: {program.description or 'Не указано'}
+Длительность: {program.duration or 'Не указана'}
+Язык: {program.language or 'Не указан'}
+Стоимость: {program.cost or 'Не указана'}
+Бюджетных мест: {program.budget_places or 0}
+Контрактных мест: {program.contract_places or 0}
+Карьерные перспективы: {program.career_prospects or 'Не указаны'}
+Требования к поступлению: {program.admission_requirements or 'Не указаны'}
+
+---
+            """
+    return formatted_data
+
+
+def format_program_summary(programs) -> str:
+    """Format only the short structured program fields for AI context"""
+    if not programs:
+        return "Данные о программах не загружены."
+
+    formatted_data = ""
+    for program in programs:
+        formatted_data += f"""
+ПРОГРАММА: {program.name}
+URL: {program.url}
+Длительность: {program.duration or 'Не указана'}
+Язык: {program.language or 'Не указан'}
+Стоимость: {program.cost or 'Не указана'}
+Бюджетных мест: {program.budget_places or 0}
+Контрактных мест: {program.contract_places or 0}
+---
+"""
+    return formatted_data
+
+
+class CatalogSnapshot:
+    """Immutable view of the program catalog at a given version.
+
+    The retrieval index needs the page chunks, which live in PageSnapshot;
+    they are loaded on first use so that readers of the structured fields
+    never touch page text.
+    """
+
+    def __init__(self, version: str, programs: list, content_hashes: dict):
+        self.version = version
+        self.programs = programs
+        self.program_text = format_program_data(programs)
+        self.summary_text = format_program_summary(programs)
+        self._content_hashes = content_hashes
+        self._retrieval_index = None
+        self._index_lock = threading.Lock()
+
+    @property
+    def retrieval_index(self) -> RetrievalIndex:
+        if self._retrieval_index is None:
+            with self._index_lock:
+                if self._retrieval_index is None:
+                    chunks = load_chunks(self._content_hashes)
+                    documents = [
+                        (program.name, chunk)
+                        for program in self.programs
+                        for chunk in chunks.get(program.id, [])
+                    ]
+                    self._retrieval_index = RetrievalIndex(documents)
+        return self._retrieval_index
+
+
+class ProgramCatalog:
+    """Process-wide cache of the program catalog.
+
+    The catalog is loaded once and reused until invalidate() is called
+    (after a scrape commits) or a periodic fingerprint check notices that
+    another process has rewritten the Program table.
+    """
+
+    def __init__(self, recheck_interval: float = CATALOG_RECHECK_INTERVAL):
+        self.recheck_interval = recheck_interval
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> CatalogSnapshot:
+        """Return the current catalog snapshot, reloading it if stale"""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.recheck_interval:
+            return snapshot
+
+        with self._lock:
+            version = self._fetch_version()
+            if self._snapshot is None or self._snapshot.version != version:
+                self._snapshot = self._load(version)
+                logger.info(f"Program catalog loaded, version {version}")
+            self._checked_at = time.monotonic()
+            return self._snapshot
+
+    def invalidate(self):
+        """Drop the cached snapshot so the next get() reloads it"""
+        with self._lock:
+            self._snapshot = None
+            self._checked_at = 0.0
+
+    def _fetch_version(self) -> str:
+        count, last_update = db.session.query(
+            db.func.count(Program.id),
+            db.func.max(Program.updated_at)
+        ).one()
+        return f"{count}:{last_update.isoformat() if last_update else '-'}"
+
+    def _load(self, version: str) -> CatalogSnapshot:
+        # Only the structured columns; page text is in PageSnapshot
+        columns = [getattr(Program, field) for field in PROGRAM_FIELDS]
+        programs = []
+        content_hashes = {}
+        for row in db.session.query(*columns, Program.curriculum_data).order_by(Program.id):
+            program = SimpleNamespace(**dict(zip(PROGRAM_FIELDS, row)))
+            programs.append(program)
+            content_hash = (row[-1] or {}).get('content_hash')
+            if content_hash:
+                content_hashes[program.id] = content_hash
+        return CatalogSnapshot(version, programs, content_hashes)
+
+
+program_catalog = ProgramCatalog()
@@ -0,0 +1,118 @@
+import os
+import queue
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime
+from app import app, db
+from models import Conversation
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Rows waiting to be written; messages beyond this are dropped, not blocked on
+CONVERSATION_LOG_QUEUE_SIZE = int(os.environ.get("CONVERSATION_LOG_QUEUE_SIZE", "10000"))
+# Flush when this many rows are buffered or this many seconds have passed
+CONVERSATION_LOG_BATCH_SIZE = int(os.environ.get("CONVERSATION_LOG_BATCH_SIZE", "200"))
+CONVERSATION_LOG_FLUSH_INTERVAL = float(os.environ.get("CONVERSATION_LOG_FLUSH_INTERVAL", "1.0"))
+
+CONVERSATION_ROWS = metrics.counter(
+    "conversation_log_rows_total", "Conversation rows by outcome (written, dropped or failed)"
+)
+
+_STOP = object()
+
+
+class ConversationLogger:
+    """Write-behind logger that stores Conversation rows in bulk inserts.
+
+    log() only enqueues a row; a background thread inserts batches on size
+    or time thresholds, so replies never wait on a database commit.
+    """
+
+    def __init__(self, max_queue: int = CONVERSATION_LOG_QUEUE_SIZE,
+                 batch_size: int = CONVERSATION_LOG_BATCH_SIZE,
+                 flush_interval: float = CONVERSATION_LOG_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def log(self, user_id: str, username: str, message: str, response: str, context: dict = None):
+        """Queue a conversation row for writing"""
+        self._ensure_started()
+        row = {
+            'telegram_user_id': user_id,
+            'username': username,
+            'message': message,
+            'response': response,
+            'context': context,
+            'created_at': datetime.utcnow()
+        }
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            CONVERSATION_ROWS.inc(outcome='dropped')
+            logger.warning(f"Conversation log queue full, dropped message from user {user_id}")
+
+    def stop(self, timeout: float = 10):
+        """Flush buffered rows and stop the writer thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="conversation-log", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                row = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                row = None
+
+            if row is _STOP:
+                self._flush(batch)
+                return
+            if row is not None:
+                batch.append(row)
+
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, batch: list):
+        if not batch:
+            return
+        with app.app_context():
+            try:
+                db.session.execute(db.insert(Conversation), batch)
+                db.session.commit()
+                self.written += len(batch)
+                CONVERSATION_ROWS.inc(len(batch), outcome='written')
+            except Exception as e:
+                db.session.rollback()
+                CONVERSATION_ROWS.inc(len(batch), outcome='failed')
+                logger.error(f"Error writing {len(batch)} conversations: {e}")
+            finally:
+                db.session.remove()
+
+
+conversation_logger = ConversationLogger()
+atexit.register(conversation_logger.stop)
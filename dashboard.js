@@ -5,9 +5,11 @@ let backgroundChart = null;
 document.addEventListener('DOMContentLoaded', function() {
     loadStats();
     loadPrograms();
+    loadMetrics();
     
-    // Refresh data every 5 minutes
+    // Refresh data every 5 minutes, latency metrics every 30 seconds
     setInterval(loadStats, 5 * 60 * 1000);
+    setInterval(loadMetrics, 30 * 1000);
 });
 
 async function loadStats() {
@@ -43,6 +45,82 @@ async function loadPrograms() {
     }
 }
 
+async function loadMetrics() {
+    try {
+        const response = await fetch('/api/metrics');
+        const data = await response.json();
+        
+        if (data.status === 'success') {
+            displayMetrics(data.metrics);
+        } else {
+            document.getElementById('stageMetrics').innerHTML = 
+                `<div class="alert alert-danger">Ошибка загрузки метрик: ${data.message}</div>`;
+        }
+    } catch (error) {
+        console.error('Error loading metrics:', error);
+    }
+}
+
+function displayMetrics(metrics) {
+    const stageNames = {
+        'profile_lookup': 'Загрузка профиля',
+        'profile_create': 'Создание профиля',
+        'history_query': 'История диалога',
+        'admission_wait': 'Ожидание в очереди',
+        'relevance': 'Проверка релевантности',
+        'retrieval': 'Поиск фрагментов',
+        'prompt_build': 'Сборка промпта',
+        'llm': 'Ответ OpenAI',
+        'llm_first_token': 'Первый токен OpenAI',
+        'reply': 'Отправка ответа',
+        'edit': 'Редактирование ответа'
+    };
+    const rows = [];
+    const addRows = (name, title, labelOf) => {
+        const metric = metrics[name];
+        if (!metric) {
+            return;
+        }
+        metric.series.forEach(series => {
+            rows.push({title: title, label: labelOf(series.labels), ...series});
+        });
+    };
+    addRows('bot_message_seconds', 'Сообщение', labels => labels.kind);
+    addRows('bot_stage_seconds', 'Этап', labels => stageNames[labels.stage] || labels.stage);
+    addRows('llm_request_seconds', 'OpenAI', labels => `${labels.purpose} (${labels.mode}, ${labels.outcome})`);
+    addRows('scrape_stage_seconds', 'Парсинг', labels => labels.stage);
+    
+    const container = document.getElementById('stageMetrics');
+    if (rows.length === 0) {
+        container.innerHTML = '<div class="text-center text-muted">Пока нет данных</div>';
+        return;
+    }
+    
+    const formatSeconds = value => value === null || value === undefined ? 'N/A' : `${(value * 1000).toFixed(1)} мс`;
+    let html = `
+        <div class="table-responsive">
+            <table class="table table-sm table-hover mb-2">
+                <thead>
+                    <tr><th></th><th>Этап</th><th class="text-end">Вызовов</th><th class="text-end">Среднее</th><th class="text-end">p50</th><th class="text-end">p95</th></tr>
+                </thead>
+                <tbody>
+    `;
+    rows.forEach(row => {
+        html += `
+            <tr>
+                <td class="text-muted">${row.title}</td>
+                <td>${row.label}</td>
+                <td class="text-end">${formatNumber(row.count)}</td>
+                <td class="text-end">${formatSeconds(row.mean)}</td>
+                <td class="text-end">${formatSeconds(row.p50)}</td>
+                <td class="text-end">${formatSeconds(row.p95)}</td>
+            </tr>
+        `;
+    });
+    html += '</tbody></table></div>';
+    container.innerHTML = html;
+}
+
 function updateConversationsChart(dailyData) {
     const ctx = document.getElementById('conversationsChart').getContext('2d');
     
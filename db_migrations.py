@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Bring an existing database up to date with the models.
+
+db.create_all() only creates missing tables, so indexes added to tables
+that already exist are created here, and data stored in an older layout
+is moved. Safe to run repeatedly; it runs on every app startup and can
+also be run by hand: python db_migrations.py
+"""
+import os
+import sys
+import fcntl
+import logging
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy.exc import IntegrityError
+from app import app, db
+
+logger = logging.getLogger(__name__)
+
+# Lock file that lets one of the processes starting together (gunicorn
+# workers, bot, cluster partitions) upgrade the schema while the others wait
+MIGRATION_LOCK_FILE = os.environ.get(
+    "MIGRATION_LOCK_FILE", os.path.join(tempfile.gettempdir(), "itmo_bot_migration.lock")
+)
+
+def upgrade_schema():
+    """Create missing indexes and move data out of outdated layouts.
+
+    Processes on one host run this one at a time; whoever comes later finds
+    nothing left to do.
+    """
+    with open(MIGRATION_LOCK_FILE, "a+") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            _upgrade_schema()
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _upgrade_schema():
+    inspector = db.inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                logger.info(f"Creating index {index.name} on {table.name}")
+                index.create(bind=db.engine)
+    
+    # Page text used to be stored inline in Program.curriculum_data. When app
+    # is first imported from models (benchmarks, scripts) the models are not
+    # defined yet and page_store cannot be imported; the move then happens on
+    # the next regular startup.
+    if 'page_snapshot' in db.metadata.tables:
+        from page_store import migrate_inline_content
+        try:
+            migrate_inline_content()
+        except IntegrityError:
+            # A process on another host moved the same pages first
+            db.session.rollback()
+            logger.info("Page content was moved concurrently, checking again")
+            migrate_inline_content()
+
+if __name__ == "__main__":
+    with app.app_context():
+        upgrade_schema()
+        print("Database schema is up to date")
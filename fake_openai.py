@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI chat completions API.
+
+Answers POST /v1/chat/completions with canned Russian text after a
+configurable delay, with or without streaming (server-sent events), and
+reports token usage like the real API. Point the bot at it with
+OPENAI_BASE_URL:
+
+    python fake_openai.py --port 8082 --latency 0.5 --token-delay 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8082/v1 python run_bot.py
+"""
+import json
+import time
+import asyncio
+import logging
+import argparse
+import itertools
+from aiohttp import web
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ANSWER_WORDS = (
+    "Программа", "готовит", "специалистов", "в", "области", "искусственного", "интеллекта,",
+    "обучение", "длится", "два", "года,", "занятия", "проходят", "на", "русском", "языке."
+)
+
+
+class FakeOpenAI:
+    """Chat completions stub: latency before the first token, then token_delay per token"""
+
+    def __init__(self, latency: float = 0.5, token_delay: float = 0.0, answer_tokens: int = 100):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.answer_tokens = answer_tokens
+        self.requests = 0
+        self.streamed = 0
+        self._ids = itertools.count(1)
+
+    def create_app(self) -> web.Application:
+        api_app = web.Application()
+        api_app.router.add_post('/v1/chat/completions', self.handle)
+        api_app.router.add_post('/chat/completions', self.handle)
+        api_app.router.add_get('/_stats', self.handle_stats)
+        return api_app
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({'requests': self.requests, 'streamed': self.streamed})
+
+    def answer_tokens_for(self, params: dict) -> list:
+        count = min(self.answer_tokens, params.get('max_tokens') or self.answer_tokens)
+        return [ANSWER_WORDS[i % len(ANSWER_WORDS)] + " " for i in range(count)]
+
+    @staticmethod
+    def prompt_tokens(params: dict) -> int:
+        # Rough estimate is enough for accounting in load tests
+        return sum(len(str(message.get('content', ''))) for message in params.get('messages', [])) // 3
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        params = await request.json()
+        self.requests += 1
+        tokens = self.answer_tokens_for(params)
+        usage = {
+            'prompt_tokens': self.prompt_tokens(params),
+            'completion_tokens': len(tokens),
+            'total_tokens': self.prompt_tokens(params) + len(tokens)
+        }
+        completion_id = f"chatcmpl-fake{next(self._ids)}"
+        created = int(time.time())
+        await asyncio.sleep(self.latency)
+
+        if not params.get('stream'):
+            await asyncio.sleep(self.token_delay * len(tokens))
+            return web.json_response({
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': created,
+                'model': params.get('model', 'gpt-4o'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': "".join(tokens).strip()},
+                    'finish_reason': 'stop'
+                }],
+                'usage': usage
+            })
+
+        self.streamed += 1
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+
+        def chunk(delta: dict, finish_reason=None, chunk_usage=None, choices=True) -> bytes:
+            payload = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': params.get('model', 'gpt-4o'),
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}] if choices else [],
+                'usage': chunk_usage
+            }
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode()
+
+        await response.write(chunk({'role': 'assistant', 'content': ''}))
+        for token in tokens:
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            await response.write(chunk({'content': token}))
+        await response.write(chunk({}, finish_reason='stop'))
+        if (params.get('stream_options') or {}).get('include_usage'):
+            await response.write(chunk({}, chunk_usage=usage, choices=False))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8082)
+    parser.add_argument('--latency', type=float, default=0.5, help='seconds before the first token')
+    parser.add_argument('--token-delay', type=float, default=0.0, help='seconds between streamed tokens')
+    parser.add_argument('--answer-tokens', type=int, default=100)
+    args = parser.parse_args()
+    stub = FakeOpenAI(args.latency, args.token_delay, args.answer_tokens)
+    web.run_app(stub.create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
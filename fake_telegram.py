@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for Telegram when testing webhook mode.
+
+serve-api runs a minimal fake Bot API (getMe, sendMessage, editMessageText,
+...) so the bot can be pointed at it with TELEGRAM_API_BASE_URL. post sends
+synthetic text-message updates to a webhook endpoint, as Telegram would.
+
+    python fake_telegram.py serve-api --port 8081
+    TELEGRAM_API_BASE_URL=http://127.0.0.1:8081 python webhook_server.py --port 8443
+    python fake_telegram.py post --url http://127.0.0.1:8443/telegram/webhook --users 50 --text "Сколько стоит обучение?"
+"""
+import os
+import time
+import asyncio
+import logging
+import argparse
+import itertools
+from aiohttp import web, ClientSession
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'ITMO AI Bot', 'username': 'itmo_ai_test_bot'}
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+
+def make_text_update(user_id: int, text: str) -> dict:
+    """Build the JSON of a private-chat text message update"""
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}', 'username': f'user{user_id}'}
+    message = {
+        'message_id': next(_message_ids),
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private', 'first_name': user['first_name']},
+        'from': user,
+        'text': text
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': next(_update_ids), 'message': message}
+
+
+class FakeBotAPI:
+    """Minimal Bot API server that accepts calls and records them"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = []
+        self._message_ids = itertools.count(1)
+
+    def create_app(self) -> web.Application:
+        api_app = web.Application()
+        api_app.router.add_post('/bot{token}/{method}', self.handle)
+        api_app.router.add_get('/bot{token}/{method}', self.handle)
+        api_app.router.add_get('/_stats', self.handle_stats)
+        return api_app
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        """Number of calls per Bot API method"""
+        counts = {}
+        for method, _ in self.calls:
+            counts[method] = counts.get(method, 0) + 1
+        return web.json_response(counts)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        if request.content_type == 'application/json':
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        self.calls.append((method, params))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.json_response({'ok': True, 'result': self.result_for(method, params)})
+
+    def result_for(self, method: str, params: dict):
+        if method == 'getMe':
+            return BOT_USER
+        if method in ('sendMessage', 'editMessageText'):
+            chat_id = int(params.get('chat_id', 0))
+            return {
+                'message_id': int(params.get('message_id') or next(self._message_ids)),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': BOT_USER,
+                'text': params.get('text', '')
+            }
+        return True
+
+
+async def post_updates(url: str, users: int, texts: list, secret: str = "", concurrency: int = 50) -> dict:
+    """POST one update per user per text to a webhook; users run concurrently"""
+    headers = {'X-Telegram-Bot-Api-Secret-Token': secret} if secret else {}
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = {}
+
+    async def run_user(session: ClientSession, user_id: int):
+        for text in texts:
+            async with semaphore:
+                async with session.post(url, json=make_text_update(user_id, text), headers=headers) as response:
+                    statuses[response.status] = statuses.get(response.status, 0) + 1
+
+    started = time.perf_counter()
+    async with ClientSession() as session:
+        await asyncio.gather(*(run_user(session, 100000 + i) for i in range(users)))
+    return {'statuses': statuses, 'seconds': round(time.perf_counter() - started, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    api_parser = subparsers.add_parser('serve-api', help='run the fake Bot API')
+    api_parser.add_argument('--host', default='127.0.0.1')
+    api_parser.add_argument('--port', type=int, default=8081)
+    api_parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every call')
+
+    post_parser = subparsers.add_parser('post', help='send synthetic updates to a webhook')
+    post_parser.add_argument('--url', required=True)
+    post_parser.add_argument('--users', type=int, default=1)
+    post_parser.add_argument('--text', action='append', help='message text; repeat for several messages')
+    post_parser.add_argument('--secret', default=os.environ.get('WEBHOOK_SECRET', ''))
+
+    args = parser.parse_args()
+    if args.command == 'serve-api':
+        web.run_app(FakeBotAPI(args.latency).create_app(), host=args.host, port=args.port)
+    else:
+        result = asyncio.run(post_updates(args.url, args.users, args.text or ['/start'], args.secret))
+        logger.info(f"Posted updates: {result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import re
+from metrics import metrics
+
+# Static answers shared by the bot's menu and the fallback used while OpenAI is degraded
+CAREER_INFO = """
+💼 Карьерные перспективы:
+
+**Искусственный интеллект:**
+• ML Engineer: 170,000 - 300,000+ ₽
+• Data Engineer: 150,000 - 280,000 ₽
+• Data Scientist: 180,000 - 350,000 ₽
+• Компании: Яндекс, Сбер, МТС, X5 Group
+
+**Управление ИИ-продуктами:**
+• AI Product Manager: 150,000 - 400,000+ ₽
+• AI Project Manager: 120,000 - 300,000 ₽
+• AI Product Analyst: 100,000 - 250,000 ₽
+• Компании: Альфа-Банк, стартапы, техкорпорации
+
+Спрос на AI-специалистов растет на 40% в год!
+        """
+
+ADMISSION_INFO = """
+📝 Как поступить:
+
+**Способы поступления:**
+1. Вступительные экзамены (дистанционно)
+2. Junior ML Contest (без экзаменов)
+3. Конкурс "Портфолио" ИТМО (85+ баллов)
+4. МегаОлимпиада ИТМО
+5. Олимпиада "Я-профессионал"
+6. Рекомендательное письмо
+
+**Ближайшие экзамены:**
+• 05.08.2025, 04:00
+• 07.08.2025, 04:00
+• 12.08.2025, 04:00
+
+**Документы:** https://abitlk.itmo.ru/
+**Подробнее:** https://abit.itmo.ru/programs/master
+        """
+
+FALLBACK_NOTICE = "⚠️ Сейчас я не могу подготовить подробный ответ, поэтому привожу основную информацию о программах."
+
+# Topic -> stems that identify it in a question
+_TOPICS = {
+    'cost': ('стоим', 'цен', 'плат', 'сколько стоит', '₽', 'руб'),
+    'places': ('бюджет', 'мест', 'контракт'),
+    'duration': ('длительн', 'срок', 'сколько лет', 'сколько учиться', 'год'),
+    'language': ('язык', 'английск', 'русск'),
+    'admission': ('поступ', 'экзамен', 'олимпиад', 'документ', 'вступительн', 'портфолио', 'конкурс'),
+    'career': ('карьер', 'зарплат', 'работ', 'ваканс', 'професси', 'трудоустр'),
+}
+_TOPIC_RES = {
+    topic: re.compile("|".join(re.escape(stem) for stem in stems))
+    for topic, stems in _TOPICS.items()
+}
+
+FALLBACK_ANSWERS = metrics.counter(
+    "bot_fallback_answers_total", "Answers built locally instead of by the LLM, by reason and topic"
+)
+
+
+def detect_topics(message: str) -> list:
+    """Topics of the question that can be answered from structured data"""
+    text = message.lower().replace('ё', 'е')
+    return [topic for topic, pattern in _TOPIC_RES.items() if pattern.search(text)]
+
+
+def _program_lines(program, topics: list) -> str:
+    lines = [f"**{program.name}**"]
+    if 'cost' in topics:
+        lines.append(f"• Стоимость: {program.cost or 'не указана'}")
+    if 'places' in topics:
+        lines.append(f"• Бюджетных мест: {program.budget_places or 0}, контрактных: {program.contract_places or 0}")
+    if 'duration' in topics:
+        lines.append(f"• Длительность: {program.duration or 'не указана'}")
+    if 'language' in topics:
+        lines.append(f"• Язык обучения: {program.language or 'не указан'}")
+    lines.append(f"• Подробнее: {program.url}")
+    return "\n".join(lines)
+
+
+def build_fallback_answer(message: str, programs, reason: str = "unavailable") -> str:
+    """Answer from the Program columns and the static texts, without the LLM"""
+    topics = detect_topics(message)
+    program_topics = [topic for topic in topics if topic not in ('admission', 'career')]
+    if not topics:
+        program_topics = ['duration', 'cost', 'places']
+    FALLBACK_ANSWERS.inc(reason=reason, topic=topics[0] if topics else 'general')
+
+    parts = [FALLBACK_NOTICE]
+    if program_topics and programs:
+        parts.append("\n\n".join(_program_lines(program, program_topics) for program in programs))
+    if 'admission' in topics:
+        parts.append(ADMISSION_INFO.strip())
+    if 'career' in topics:
+        parts.append(CAREER_INFO.strip())
+    if len(parts) == 1:
+        parts.append("Данные о программах загружаются. Попробуйте позже.")
+    parts.append("Попробуйте задать вопрос еще раз через пару минут — тогда я смогу ответить подробнее.")
+    return "\n\n".join(parts)
@@ -0,0 +1,208 @@
+import os
+import time
+import uuid
+import queue
+import fcntl
+import logging
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from app import app, db
+from models import RefreshJob
+from web_scraper import scrape_and_store_program_data
+from recommendations import RECOMMENDATION_MATRIX_ON_REFRESH, refresh_recommendation_matrix
+
+logger = logging.getLogger(__name__)
+
+# Lock file shared by all processes on the host (gunicorn workers, bot)
+REFRESH_LOCK_FILE = os.environ.get(
+    "REFRESH_LOCK_FILE", os.path.join(tempfile.gettempdir(), "itmo_bot_refresh.lock")
+)
+# Skip startup refreshes if another process refreshed less than this many seconds ago
+REFRESH_MIN_INTERVAL = float(os.environ.get("REFRESH_MIN_INTERVAL", "600"))
+# Queued or running refresh jobs older than this many seconds are marked failed
+# (the process that accepted them has exited)
+REFRESH_JOB_TIMEOUT = float(os.environ.get("REFRESH_JOB_TIMEOUT", "3600"))
+
+ACTIVE_JOB_STATUSES = ('queued', 'running')
+
+
+def refresh_program_data(min_interval: float = 0) -> dict:
+    """Scrape program data while holding the cross-process refresh lock.
+
+    Returns the scrape summary, or a dict with 'skipped' set when another
+    process holds the lock or refreshed within min_interval seconds.
+    """
+    with open(REFRESH_LOCK_FILE, "a+") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logger.info("Program data refresh already running in another process")
+            return {'skipped': 'locked'}
+
+        try:
+            # The lock file holds the time of the last successful refresh
+            lock_file.seek(0)
+            try:
+                last_refresh = float(lock_file.read().strip() or 0)
+            except ValueError:
+                last_refresh = 0.0
+            if time.time() - last_refresh < min_interval:
+                logger.info("Program data refreshed recently, skipping")
+                return {'skipped': 'recent'}
+
+            with app.app_context():
+                summary = scrape_and_store_program_data()
+
+            if RECOMMENDATION_MATRIX_ON_REFRESH:
+                try:
+                    summary['recommendations'] = refresh_recommendation_matrix()
+                except Exception as e:
+                    logger.error(f"Error building recommendation matrix: {e}")
+
+            lock_file.seek(0)
+            lock_file.truncate()
+            lock_file.write(str(time.time()))
+            lock_file.flush()
+            return summary
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def start_background_refresh() -> threading.Thread:
+    """Refresh program data in a daemon thread so startup is not blocked"""
+    def run():
+        try:
+            summary = refresh_program_data(min_interval=REFRESH_MIN_INTERVAL)
+            logger.info(f"Background program data refresh finished: {summary}")
+        except Exception as e:
+            logger.error(f"Error refreshing program data: {e}")
+
+    thread = threading.Thread(target=run, name="program-refresh", daemon=True)
+    thread.start()
+    return thread
+
+
+def _job_dict(job: RefreshJob) -> dict:
+    def timestamp(value):
+        return value.isoformat() if value else None
+
+    return {
+        'id': job.id,
+        'status': job.status,
+        'created_at': timestamp(job.created_at),
+        'started_at': timestamp(job.started_at),
+        'finished_at': timestamp(job.finished_at),
+        'duration': job.duration,
+        'result': job.result,
+        'error': job.error
+    }
+
+
+class RefreshJobQueue:
+    """Runs program data refreshes one at a time in a background thread.
+
+    Jobs are stored in the database, so every web worker reports jobs
+    accepted by the others. Enqueueing while a refresh is queued or running
+    in any worker returns the existing job instead of starting a second one.
+    """
+
+    def __init__(self, history_size: int = 20, timeout: float = REFRESH_JOB_TIMEOUT):
+        self.history_size = history_size
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def enqueue(self) -> dict:
+        """Queue a refresh (or join the pending one) and return its job"""
+        with self._lock, app.app_context():
+            active = self._active_job()
+            if active:
+                return _job_dict(active)
+
+            job = RefreshJob(id=uuid.uuid4().hex, status='queued', created_at=datetime.utcnow())
+            db.session.add(job)
+            db.session.commit()
+            self._prune()
+            self._ensure_worker()
+            self._queue.put(job.id)
+            return _job_dict(job)
+
+    def get(self, job_id: str) -> dict:
+        with app.app_context():
+            job = db.session.get(RefreshJob, job_id)
+            return _job_dict(job) if job else None
+
+    def status(self) -> dict:
+        """Return the active job and the last finished one"""
+        with app.app_context():
+            active = self._active_job()
+            last_run = RefreshJob.query.filter(
+                RefreshJob.status.notin_(ACTIVE_JOB_STATUSES)
+            ).order_by(RefreshJob.finished_at.desc()).first()
+            return {
+                'active_job': _job_dict(active) if active else None,
+                'last_run': _job_dict(last_run) if last_run else None
+            }
+
+    def _active_job(self):
+        # A job left queued or running by a process that exited never finishes
+        cutoff = datetime.utcnow() - timedelta(seconds=self.timeout)
+        abandoned = RefreshJob.query.filter(
+            RefreshJob.status.in_(ACTIVE_JOB_STATUSES), RefreshJob.created_at < cutoff
+        ).all()
+        for job in abandoned:
+            logger.warning(f"Refresh job {job.id} abandoned in state {job.status}")
+            job.status = 'failed'
+            job.finished_at = datetime.utcnow()
+            job.error = "Задача не завершилась: процесс, который ее выполнял, остановлен"
+        if abandoned:
+            db.session.commit()
+        return RefreshJob.query.filter(
+            RefreshJob.status.in_(ACTIVE_JOB_STATUSES)
+        ).order_by(RefreshJob.created_at).first()
+
+    def _prune(self):
+        old_jobs = RefreshJob.query.filter(
+            RefreshJob.status.notin_(ACTIVE_JOB_STATUSES)
+        ).order_by(RefreshJob.created_at.desc()).offset(self.history_size).all()
+        for job in old_jobs:
+            db.session.delete(job)
+        if old_jobs:
+            db.session.commit()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="refresh-jobs", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            with app.app_context():
+                job = db.session.get(RefreshJob, job_id)
+                job.status = 'running'
+                job.started_at = datetime.utcnow()
+                db.session.commit()
+            started = time.monotonic()
+
+            try:
+                result = refresh_program_data()
+                status = 'skipped' if 'skipped' in result else 'succeeded'
+                error = None
+            except Exception as e:
+                logger.error(f"Refresh job {job_id} failed: {e}")
+                result, status, error = None, 'failed', str(e)
+
+            with app.app_context():
+                job = db.session.get(RefreshJob, job_id)
+                job.status = status
+                job.finished_at = datetime.utcnow()
+                job.duration = round(time.monotonic() - started, 3)
+                job.result = result
+                job.error = error
+                db.session.commit()
+
+
+refresh_jobs = RefreshJobQueue()
@@ -0,0 +1,455 @@
+import os
+import json
+import time
+import hashlib
+import asyncio
+import logging
+from collections import deque
+from openai import AsyncOpenAI
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of chat completions in flight at once (per process)
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+# Per-call timeout in seconds, including time spent waiting for a free slot
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "60"))
+# Fail fast after this many consecutive failed or timed-out calls, for
+# LLM_BREAKER_COOLDOWN seconds; then a single probe call decides whether to recover
+LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.environ.get("LLM_BREAKER_COOLDOWN", "30"))
+# Send a duplicate request when the first one is slower than this percentile
+# of recent calls of the same purpose (e.g. 95); 0 disables hedging
+LLM_HEDGE_PERCENTILE = float(os.environ.get("LLM_HEDGE_PERCENTILE", "0"))
+LLM_HEDGE_MIN_SAMPLES = 20
+LLM_LATENCY_SAMPLES = 200
+
+LLM_CALLS = metrics.counter("llm_calls_total", "LLM calls by purpose and mode (upstream or coalesced)")
+LLM_TOKENS = metrics.counter("llm_tokens_total", "Tokens reported by the API by purpose and kind (prompt or completion)")
+LLM_REQUEST_SECONDS = metrics.histogram(
+    "llm_request_seconds", "Duration of upstream LLM calls, slot waiting included, by purpose, mode and outcome"
+)
+LLM_HEDGES = metrics.counter("llm_hedged_requests_total", "Duplicate LLM requests sent after the hedge delay, by purpose and winner")
+LLM_CIRCUIT = metrics.counter("llm_circuit_transitions_total", "LLM circuit breaker state changes, by new state")
+LLM_REJECTED = metrics.counter("llm_circuit_rejected_total", "LLM calls refused while the circuit was open, by purpose")
+
+
+class CircuitOpenError(Exception):
+    """The LLM upstream is considered degraded and calls are not attempted"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker: closed -> open -> half-open -> closed"""
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """Whether an upstream call could start now; moves an open circuit to half-open after the cooldown"""
+        if self.state == 'open' and time.monotonic() - self._opened_at >= self.cooldown:
+            self._transition('half_open')
+        return self.state == 'closed' or (self.state == 'half_open' and not self._probing)
+
+    def acquire(self) -> bool:
+        """Claim the right to start an upstream call; in half-open state only one probe gets it"""
+        if not self.allow():
+            return False
+        if self.state == 'half_open':
+            self._probing = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self._probing = False
+        if self.state != 'closed':
+            self._transition('closed')
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == 'half_open' or (self.state == 'closed' and self.failures >= self.failure_threshold):
+            self._opened_at = time.monotonic()
+            self._transition('open')
+
+    def record_abandoned(self):
+        """A call ended without a verdict (cancelled); an abandoned probe restarts the cooldown"""
+        if self.state == 'half_open' and self._probing:
+            self._probing = False
+            self._opened_at = time.monotonic()
+            self._transition('open')
+
+    def _transition(self, state: str):
+        self.state = state
+        LLM_CIRCUIT.inc(state=state)
+        if state == 'open':
+            logger.warning(f"LLM circuit opened after {self.failures} failures, failing fast for {self.cooldown}s")
+        else:
+            logger.info(f"LLM circuit {state.replace('_', '-')}")
+
+
+class TokenUsage:
+    """Prompt/completion token accounting per call purpose"""
+
+    def record(self, purpose: str, prompt_tokens: int, completion_tokens: int,
+               seconds: float, estimated_prompt_tokens: int = None):
+        LLM_TOKENS.inc(prompt_tokens, purpose=purpose, kind='prompt')
+        LLM_TOKENS.inc(completion_tokens, purpose=purpose, kind='completion')
+        logger.info(
+            f"LLM call ({purpose}): {prompt_tokens} prompt + {completion_tokens} completion tokens "
+            f"in {seconds:.2f}s (estimated prompt: {estimated_prompt_tokens})"
+        )
+
+
+class _SharedCall:
+    """One upstream completion awaited by one or more callers"""
+
+    def __init__(self, batch: bool = False):
+        self.batch = batch
+        self.task = None
+        self.subscribers = 1
+        # Set when a caller gave up on its deadline; the call is then judged a timeout
+        self.deadline_missed = False
+
+
+class _SharedStream:
+    """Buffered deltas of one upstream stream, readable by several consumers"""
+
+    def __init__(self):
+        self.deltas = []
+        self.done = False
+        self.error = None
+        self.subscribers = 1
+        self.task = None
+        self.deadline_missed = False
+        self._changed = asyncio.Event()
+
+    def publish(self, delta: str = None, error: BaseException = None, done: bool = False):
+        if delta is not None:
+            self.deltas.append(delta)
+        if error is not None:
+            self.error = error
+        self.done = self.done or done
+        self._changed.set()
+
+    async def read(self):
+        index = 0
+        while True:
+            while index < len(self.deltas):
+                yield self.deltas[index]
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            self._changed.clear()
+            await self._changed.wait()
+
+
+class LLMClient:
+    """Async wrapper around the OpenAI chat API with bounded concurrency.
+
+    Identical requests that are in flight at the same time share a single
+    upstream call (single-flight); the result is fanned out to every caller.
+    A circuit breaker fails calls fast while the upstream keeps failing, and
+    slow calls can be hedged with a duplicate request once they exceed a
+    percentile of recent latencies.
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, timeout: float = LLM_TIMEOUT):
+        self.client = AsyncOpenAI(
+            api_key=os.environ.get("OPENAI_API_KEY", "your-openai-key"),
+            timeout=timeout,
+            max_retries=1
+        )
+        self.timeout = timeout
+        self.usage = TokenUsage()
+        self.upstream_calls = 0
+        self.coalesced_calls = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._inflight = {}
+        self._inflight_streams = {}
+        self.breaker = CircuitBreaker()
+        self._latencies = {}
+
+    @staticmethod
+    def request_key(kwargs: dict) -> str:
+        """Fingerprint of the request parameters used to detect duplicates"""
+        payload = json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _record_latency(self, purpose: str, mode: str, seconds: float):
+        self._latencies.setdefault((purpose, mode), deque(maxlen=LLM_LATENCY_SAMPLES)).append(seconds)
+
+    def _hedge_delay(self, purpose: str, mode: str):
+        """Seconds after which to send a duplicate request, or None to not hedge"""
+        samples = self._latencies.get((purpose, mode))
+        if LLM_HEDGE_PERCENTILE <= 0 or not samples or len(samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(int(len(ordered) * LLM_HEDGE_PERCENTILE / 100), len(ordered) - 1)]
+
+    async def _hedged(self, purpose: str, mode: str, attempt, discard=None):
+        """Run attempt(); if it is slower than the hedge delay, race a second one.
+
+        The first successful result wins and the other attempt is cancelled,
+        or handed to discard() if it also produced a result. A second attempt
+        is only started when a concurrency slot is free.
+        """
+        def start():
+            task = asyncio.create_task(attempt())
+            # A cancelled loser may still fail; do not report that as unretrieved
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+            return task
+
+        delay = self._hedge_delay(purpose, mode)
+        tasks = [start()]
+        winner = None
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and not self._semaphore.locked():
+                    logger.info(f"Hedging slow LLM {mode} ({purpose}) after {delay:.2f}s")
+                    tasks.append(start())
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in tasks:
+                    if task in done and task.exception() is None:
+                        winner = task
+                        if len(tasks) > 1:
+                            LLM_HEDGES.inc(purpose=purpose, winner='hedge' if task is tasks[1] else 'primary')
+                        return task.result()
+            # Every attempt failed: report the first one's error
+            return tasks[0].result()
+        finally:
+            for task in tasks:
+                if task is winner:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif discard is not None and not task.cancelled() and task.exception() is None:
+                    await discard(task.result())
+
+    async def complete(self, timeout: float = None, purpose: str = "chat",
+                       estimated_prompt_tokens: int = None, batch: bool = False, **kwargs):
+        """Run a chat completion, waiting for a free slot first.
+
+        Raises asyncio.TimeoutError if the call (queueing included) does not
+        finish in time, and CircuitOpenError without calling the API while the
+        upstream is considered degraded. A caller that gives up does not
+        cancel the upstream request if other callers are waiting for the same
+        result; once the last one has gone, the request is cancelled.
+
+        Batch calls (background jobs) are not hedged, neither consult nor feed
+        the circuit breaker, and their timeout starts once a slot is acquired.
+        """
+        key = self.request_key(kwargs)
+        shared = self._inflight.get(key)
+        if shared is None:
+            if not batch and not self.breaker.acquire():
+                LLM_REJECTED.inc(purpose=purpose)
+                raise CircuitOpenError("LLM circuit is open")
+            self.upstream_calls += 1
+            LLM_CALLS.inc(purpose=purpose, mode='upstream')
+            shared = _SharedCall(batch)
+            self._inflight[key] = shared
+            shared.task = asyncio.create_task(
+                self._complete(key, shared, purpose, estimated_prompt_tokens, timeout, **kwargs)
+            )
+            # Keep a failure from being reported as unretrieved if every caller timed out
+            shared.task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        else:
+            shared.subscribers += 1
+            self.coalesced_calls += 1
+            LLM_CALLS.inc(purpose=purpose, mode='coalesced')
+            logger.info(f"Coalesced LLM call ({purpose}) with an identical request in flight")
+        try:
+            # A batch caller's timeout is enforced around the upstream call instead
+            return await asyncio.wait_for(asyncio.shield(shared.task), None if batch else timeout or self.timeout)
+        except asyncio.TimeoutError:
+            # The breaker hears about it once, from _complete, however many callers gave up
+            shared.deadline_missed = True
+            raise
+        finally:
+            shared.subscribers -= 1
+            if shared.subscribers == 0 and not shared.task.done():
+                shared.task.cancel()
+
+    async def _complete(self, key: str, shared: _SharedCall, purpose: str, estimated_prompt_tokens: int,
+                        timeout: float, **kwargs):
+        started = time.monotonic()
+        outcome = 'error'
+        try:
+            if shared.batch:
+                response = await self._create(purpose, kwargs, timeout or self.timeout)
+            else:
+                async with asyncio.timeout(self.timeout):
+                    response = await self._hedged(purpose, 'complete', lambda: self._create(purpose, kwargs))
+            outcome = 'ok'
+        except asyncio.TimeoutError:
+            outcome = 'timeout'
+            raise
+        except asyncio.CancelledError:
+            # Cancelled because every caller missed its deadline, or because they all went away
+            outcome = 'timeout' if shared.deadline_missed else 'cancelled'
+            raise
+        finally:
+            if not shared.batch:
+                self._judge(outcome)
+            if self._inflight.get(key) is shared:
+                del self._inflight[key]
+            LLM_REQUEST_SECONDS.observe(time.monotonic() - started, purpose=purpose, outcome=outcome, mode='complete')
+        if response.usage:
+            self.usage.record(purpose, response.usage.prompt_tokens, response.usage.completion_tokens,
+                              time.monotonic() - started, estimated_prompt_tokens)
+        return response
+
+    def _judge(self, outcome: str):
+        """Report the outcome of one upstream call to the circuit breaker"""
+        if outcome == 'ok':
+            self.breaker.record_success()
+        elif outcome == 'cancelled':
+            self.breaker.record_abandoned()
+        else:
+            self.breaker.record_failure()
+
+    async def _create(self, purpose: str, kwargs: dict, slot_timeout: float = None):
+        """One upstream completion attempt; slot_timeout limits it once a slot is acquired"""
+        started = time.monotonic()
+        async with self._semaphore:
+            async with asyncio.timeout(slot_timeout):
+                response = await self.client.chat.completions.create(**kwargs)
+        self._record_latency(purpose, 'complete', time.monotonic() - started)
+        return response
+
+    async def _open_stream(self, purpose: str, kwargs: dict):
+        """One upstream streaming attempt, up to its first chunk.
+
+        Returns (stream, first_chunk) and keeps a concurrency slot until
+        _close_stream() is called.
+        """
+        started = time.monotonic()
+        await self._semaphore.acquire()
+        try:
+            stream = await self.client.chat.completions.create(
+                stream=True, stream_options={"include_usage": True}, **kwargs
+            )
+            try:
+                first_chunk = await stream.__anext__()
+            except StopAsyncIteration:
+                first_chunk = None
+            except BaseException:
+                await stream.close()
+                raise
+        except BaseException:
+            self._semaphore.release()
+            raise
+        self._record_latency(purpose, 'stream', time.monotonic() - started)
+        return stream, first_chunk
+
+    async def _close_stream(self, opened):
+        stream, _ = opened
+        try:
+            await stream.close()
+        finally:
+            self._semaphore.release()
+
+    async def stream(self, timeout: float = None, purpose: str = "chat",
+                     estimated_prompt_tokens: int = None, first_token_timeout: float = None, **kwargs):
+        """Run a streaming chat completion and yield content deltas.
+
+        The timeout covers the whole stream and first_token_timeout, if
+        given, the wait for the first delta; when a deadline passes while
+        waiting for a delta the consumer gets asyncio.TimeoutError. Time the
+        consumer spends between deltas is never interrupted. Consumers that join an identical stream already
+        in flight first receive the deltas produced so far. The upstream
+        response is closed once the last consumer has gone away.
+        """
+        key = self.request_key(kwargs)
+        shared = self._inflight_streams.get(key)
+        if shared is None:
+            if not self.breaker.acquire():
+                LLM_REJECTED.inc(purpose=purpose)
+                raise CircuitOpenError("LLM circuit is open")
+            self.upstream_calls += 1
+            LLM_CALLS.inc(purpose=purpose, mode='upstream')
+            shared = _SharedStream()
+            self._inflight_streams[key] = shared
+            shared.task = asyncio.create_task(
+                self._pump_stream(key, shared, purpose, estimated_prompt_tokens, **kwargs)
+            )
+        else:
+            shared.subscribers += 1
+            self.coalesced_calls += 1
+            LLM_CALLS.inc(purpose=purpose, mode='coalesced')
+            logger.info(f"Coalesced LLM stream ({purpose}) with an identical request in flight")
+
+        loop = asyncio.get_running_loop()
+        stream_deadline = loop.time() + (timeout or self.timeout)
+        deadline = min(stream_deadline, loop.time() + first_token_timeout) if first_token_timeout else stream_deadline
+        deltas = shared.read()
+        try:
+            while True:
+                # Only the wait for the next delta is timed, never the consumer's
+                # work while suspended at yield
+                try:
+                    delta = await asyncio.wait_for(anext(deltas), max(deadline - loop.time(), 0))
+                except StopAsyncIteration:
+                    break
+                deadline = stream_deadline
+                yield delta
+        except asyncio.TimeoutError:
+            # Judged once by _pump_stream when the upstream stream ends or is cancelled
+            shared.deadline_missed = True
+            raise
+        finally:
+            await deltas.aclose()
+            shared.subscribers -= 1
+            if shared.subscribers == 0 and not shared.done:
+                shared.task.cancel()
+
+    async def _pump_stream(self, key: str, shared: _SharedStream, purpose: str,
+                           estimated_prompt_tokens: int, **kwargs):
+        started = time.monotonic()
+        outcome = 'error'
+
+        def handle(chunk):
+            if chunk.usage:
+                self.usage.record(purpose, chunk.usage.prompt_tokens, chunk.usage.completion_tokens,
+                                  time.monotonic() - started, estimated_prompt_tokens)
+            if chunk.choices and chunk.choices[0].delta.content:
+                shared.publish(chunk.choices[0].delta.content)
+
+        try:
+            async with asyncio.timeout(self.timeout):
+                opened = await self._hedged(
+                    purpose, 'stream', lambda: self._open_stream(purpose, kwargs), discard=self._close_stream
+                )
+                stream, first_chunk = opened
+                try:
+                    if first_chunk is not None:
+                        handle(first_chunk)
+                        async for chunk in stream:
+                            handle(chunk)
+                finally:
+                    await self._close_stream(opened)
+            shared.publish(done=True)
+            outcome = 'ok'
+        except BaseException as e:
+            shared.publish(error=e, done=True)
+            if isinstance(e, asyncio.CancelledError):
+                # Cancelled because every consumer missed its deadline, or because they all went away
+                outcome = 'timeout' if shared.deadline_missed else 'cancelled'
+                raise
+            outcome = 'timeout' if isinstance(e, asyncio.TimeoutError) else 'error'
+        finally:
+            self._judge(outcome)
+            LLM_REQUEST_SECONDS.observe(time.monotonic() - started, purpose=purpose, outcome=outcome, mode='stream')
+            # Later identical requests start a fresh call instead of replaying this one
+            if self._inflight_streams.get(key) is shared:
+                del self._inflight_streams[key]
@@ -1,22 +1,28 @@
 import os
 import logging
-import threading
 from app import app
-from web_scraper import scrape_and_store_program_data
+from jobs import refresh_program_data, start_background_refresh
 import routes  # noqa: F401
 
 logger = logging.getLogger(__name__)
 
+# How program data is refreshed when the app starts:
+#   background - serve the stored catalog immediately, refresh in a daemon thread
+#   blocking   - refresh before serving (old behaviour)
+#   off        - do not refresh at startup (use /refresh-data or a cron job)
+STARTUP_REFRESH = os.environ.get("STARTUP_REFRESH", "background")
+
 def initialize_data():
     """Initialize the database with scraped program data"""
     try:
-        with app.app_context():
-            scrape_and_store_program_data()
-            logger.info("Program data scraped and stored successfully")
+        summary = refresh_program_data()
+        logger.info(f"Program data scraped and stored: {summary}")
     except Exception as e:
         logger.error(f"Error initializing data: {e}")
 
-# Initialize data on startup
-initialize_data()
+if STARTUP_REFRESH == "blocking":
+    initialize_data()
+elif STARTUP_REFRESH == "background":
+    start_background_refresh()
 
 logger.info("Flask web application initialized. To start Telegram bot, run: python run_bot.py")
@@ -0,0 +1,312 @@
+import os
+import json
+import time
+import atexit
+import bisect
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Every process (web workers, bot, bot workers) writes its metrics to a file
+# in this directory; /metrics merges them. Empty disables the export.
+METRICS_DIR = os.environ.get("METRICS_DIR", os.path.join(tempfile.gettempdir(), "itmo_bot_metrics"))
+METRICS_EXPORT_INTERVAL = float(os.environ.get("METRICS_EXPORT_INTERVAL", "10"))
+# Files not updated for this many seconds belong to stopped processes and are ignored
+METRICS_STALE_AFTER = float(os.environ.get("METRICS_STALE_AFTER", "120"))
+
+# Histogram bucket bounds in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(labels, extra: tuple = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic count per label set"""
+
+    type = 'counter'
+
+    def __init__(self, registry, name: str, documentation: str):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self.registry.ensure_exporter()
+
+    def snapshot(self) -> dict:
+        return {
+            'type': self.type,
+            'help': self.documentation,
+            'values': [[list(key), value] for key, value in self.values.items()]
+        }
+
+
+class Histogram:
+    """Bucketed observations (counts are per bucket, not cumulative) per label set"""
+
+    type = 'histogram'
+
+    def __init__(self, registry, name: str, documentation: str, buckets: tuple = LATENCY_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.values = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.registry.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            entry['counts'][index] += 1
+            entry['sum'] += value
+            entry['count'] += 1
+        self.registry.ensure_exporter()
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block, also when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self) -> dict:
+        return {
+            'type': self.type,
+            'help': self.documentation,
+            'buckets': list(self.buckets),
+            'values': [
+                [list(key), {'counts': list(entry['counts']), 'sum': entry['sum'], 'count': entry['count']}]
+                for key, entry in self.values.items()
+            ]
+        }
+
+
+def histogram_quantile(quantile: float, buckets: list, counts: list) -> float:
+    """Estimate a quantile from bucket counts by linear interpolation, like Prometheus"""
+    total = sum(counts)
+    if not total:
+        return None
+    rank = quantile * total
+    seen = 0
+    for index, count in enumerate(counts):
+        if seen + count >= rank and count:
+            lower = buckets[index - 1] if index > 0 else 0.0
+            if index == len(buckets):
+                # Above the largest bound: the best estimate is that bound
+                return buckets[-1]
+            return lower + (buckets[index] - lower) * (rank - seen) / count
+        seen += count
+    return buckets[-1]
+
+
+class MetricsRegistry:
+    """Process-wide counters and histograms, shared with other processes via files.
+
+    Recording only updates in-memory values; a daemon thread started on first
+    use writes a JSON snapshot to METRICS_DIR every METRICS_EXPORT_INTERVAL
+    seconds. collect() merges the live values of this process with the
+    snapshots of the others.
+    """
+
+    def __init__(self, directory: str = METRICS_DIR, interval: float = METRICS_EXPORT_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self.lock = threading.Lock()
+        self._metrics = {}
+        self._exporter = None
+        self._stop = threading.Event()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._register(Counter, name, documentation)
+
+    def histogram(self, name: str, documentation: str, buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, buckets)
+
+    def _register(self, cls, name: str, *args):
+        with self.lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(self, name, *args)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.type}")
+            return metric
+
+    def snapshot(self) -> dict:
+        """Values recorded in this process"""
+        with self.lock:
+            return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def collect(self) -> dict:
+        """Values of this process merged with fresh snapshots of the other processes"""
+        merged = self.snapshot()
+        for snapshot in self._read_other_snapshots():
+            for name, metric in snapshot.items():
+                target = merged.setdefault(name, {**metric, 'values': []})
+                if target['type'] != metric['type'] or target.get('buckets') != metric.get('buckets'):
+                    logger.warning(f"Skipping metric {name} with a conflicting definition")
+                    continue
+                target['values'] = self._merge_values(target['type'], target['values'], metric['values'])
+        return merged
+
+    @staticmethod
+    def _merge_values(metric_type: str, values: list, other: list) -> list:
+        merged = {tuple(map(tuple, key)): value for key, value in values}
+        for key, value in other:
+            key = tuple(map(tuple, key))
+            current = merged.get(key)
+            if current is None:
+                merged[key] = value
+            elif metric_type == 'histogram':
+                merged[key] = {
+                    'counts': [a + b for a, b in zip(current['counts'], value['counts'])],
+                    'sum': current['sum'] + value['sum'],
+                    'count': current['count'] + value['count']
+                }
+            else:
+                merged[key] = current + value
+        return [[list(key), value] for key, value in merged.items()]
+
+    def render_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, metric in sorted(self.collect().items()):
+            if not metric['values']:
+                continue
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            for key, value in sorted(metric['values']):
+                labels = [tuple(pair) for pair in key]
+                if metric['type'] != 'histogram':
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric['buckets'] + [float('inf')], value['counts']):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels, (('le', _format_value(bound)),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value['sum'])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, quantiles: tuple = (0.5, 0.95)) -> dict:
+        """Merged metrics with histograms reduced to count, mean and quantiles"""
+        result = {}
+        for name, metric in sorted(self.collect().items()):
+            series = []
+            for key, value in sorted(metric['values']):
+                labels = {label: label_value for label, label_value in key}
+                if metric['type'] != 'histogram':
+                    series.append({'labels': labels, 'value': value})
+                    continue
+                series.append({
+                    'labels': labels,
+                    'count': value['count'],
+                    'mean': value['sum'] / value['count'] if value['count'] else None,
+                    **{f"p{round(q * 100)}": histogram_quantile(q, metric['buckets'], value['counts'])
+                       for q in quantiles}
+                })
+            result[name] = {'type': metric['type'], 'help': metric['help'], 'series': series}
+        return result
+
+    def ensure_exporter(self):
+        if self._exporter is not None or not self.directory:
+            return
+        with self.lock:
+            if self._exporter is None:
+                self._stop.clear()
+                self._exporter = threading.Thread(target=self._run_exporter, name="metrics-export", daemon=True)
+                self._exporter.start()
+
+    def stop(self):
+        """Stop exporting and remove this process's snapshot file"""
+        exporter, self._exporter = self._exporter, None
+        if exporter is None:
+            return
+        self._stop.set()
+        exporter.join(5)
+        try:
+            os.remove(self._snapshot_path())
+        except OSError:
+            pass
+
+    def export(self):
+        """Write this process's snapshot file atomically"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._snapshot_path()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _run_exporter(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.export()
+            except Exception as e:
+                logger.error(f"Error exporting metrics: {e}")
+
+    def _snapshot_path(self, pid: int = None) -> str:
+        return os.path.join(self.directory, f"{pid or os.getpid()}.json")
+
+    def _read_other_snapshots(self) -> list:
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        own_file = os.path.basename(self._snapshot_path())
+        snapshots = []
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith('.json') or file_name == own_file:
+                continue
+            path = os.path.join(self.directory, file_name)
+            try:
+                if time.time() - os.path.getmtime(path) > METRICS_STALE_AFTER:
+                    continue
+                with open(path, encoding='utf-8') as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable metrics file {path}: {e}")
+        return snapshots
+
+    def _after_fork(self):
+        # A forked worker starts with empty values and its own exporter thread
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._exporter = None
+        for metric in self._metrics.values():
+            metric.values = {}
+
+
+metrics = MetricsRegistry()
+atexit.register(metrics.stop)
+
+# Shared across modules so every stage of a reply lands in one histogram
+STAGE_SECONDS = metrics.histogram(
+    "bot_stage_seconds", "Time spent in each stage of handling a Telegram message"
+)
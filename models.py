@@ -23,13 +23,18 @@ class Program(db.Model):
 
 class Conversation(db.Model):
     """Model for storing user conversations"""
+    __table_args__ = (
+        # Per-user history lookup: WHERE telegram_user_id = ? ORDER BY created_at DESC
+        db.Index('ix_conversation_user_created', 'telegram_user_id', 'created_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     telegram_user_id = db.Column(db.String(50), nullable=False)
     username = db.Column(db.String(100))
     message = db.Column(Text, nullable=False)
     response = db.Column(Text)
     context = db.Column(JSON)  # Store conversation context
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
 class UserProfile(db.Model):
     """Model for storing user background information"""
@@ -46,3 +51,42 @@ class UserProfile(db.Model):
     career_goals = db.Column(db.String(200))  # Career aspirations
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class Recommendation(db.Model):
+    """Pre-generated survey recommendation for a profile bucket and catalog version"""
+    __table_args__ = (
+        db.UniqueConstraint('bucket', 'catalog_version', name='uq_recommendation_bucket_version'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.String(100), nullable=False)  # e.g. "math|junior|ml"
+    catalog_version = db.Column(db.String(100), nullable=False)
+    text = db.Column(Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class PageSnapshot(db.Model):
+    """Compressed text of a scraped program page, stored once per distinct content"""
+    __table_args__ = (
+        db.UniqueConstraint('program_id', 'content_hash', name='uq_page_snapshot_program_hash'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    program_id = db.Column(db.Integer, db.ForeignKey('program.id'), nullable=False, index=True)
+    url = db.Column(db.String(500), nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False, index=True)  # sha256 of the page text
+    content = db.deferred(db.Column(db.LargeBinary, nullable=False))  # zlib-compressed page text
+    chunks = db.deferred(db.Column(db.LargeBinary))  # zlib-compressed JSON list of retrieval chunks
+    content_size = db.Column(db.Integer)  # uncompressed size in characters
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_seen_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class RefreshJob(db.Model):
+    """Program data refresh requested from the dashboard, visible to every web worker"""
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued, running, succeeded, skipped, failed
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    duration = db.Column(db.Float)  # seconds
+    result = db.Column(JSON)  # scrape summary or {'skipped': reason}
+    error = db.Column(Text)
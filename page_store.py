@@ -0,0 +1,108 @@
+import os
+import json
+import zlib
+import hashlib
+import logging
+from datetime import datetime
+from app import db
+from models import PageSnapshot, Program
+
+logger = logging.getLogger(__name__)
+
+# Distinct page versions kept per program; older snapshots are pruned
+PAGE_SNAPSHOT_HISTORY = int(os.environ.get("PAGE_SNAPSHOT_HISTORY", "20"))
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def _compress(text: str) -> bytes:
+    return zlib.compress(text.encode('utf-8'), 6)
+
+
+def _decompress(data: bytes) -> str:
+    return zlib.decompress(data).decode('utf-8') if data else ""
+
+
+def store_snapshot(program_id: int, url: str, content: str, chunks: list) -> str:
+    """Save page text for a program unless the same content is already stored.
+
+    Returns the content hash to reference from Program.curriculum_data.
+    The caller commits.
+    """
+    digest = content_hash(content)
+    snapshot = PageSnapshot.query.filter_by(program_id=program_id, content_hash=digest).first()
+    if snapshot is not None:
+        snapshot.last_seen_at = datetime.utcnow()
+        return digest
+
+    db.session.add(PageSnapshot(
+        program_id=program_id,
+        url=url,
+        content_hash=digest,
+        content=_compress(content),
+        chunks=_compress(json.dumps(chunks, ensure_ascii=False)),
+        content_size=len(content)
+    ))
+    _prune_history(program_id)
+    return digest
+
+
+def _prune_history(program_id: int, keep: int = PAGE_SNAPSHOT_HISTORY):
+    stale_ids = [
+        snapshot_id for (snapshot_id,) in db.session.query(PageSnapshot.id)
+        .filter_by(program_id=program_id)
+        .order_by(PageSnapshot.last_seen_at.desc(), PageSnapshot.id.desc())
+        .offset(keep)
+    ]
+    if stale_ids:
+        PageSnapshot.query.filter(PageSnapshot.id.in_(stale_ids)).delete(synchronize_session=False)
+
+
+def load_chunks(hashes: dict) -> dict:
+    """Retrieval chunks for {program_id: content_hash}, keyed by program_id"""
+    if not hashes:
+        return {}
+    rows = db.session.query(PageSnapshot.program_id, PageSnapshot.content_hash, PageSnapshot.chunks).filter(
+        PageSnapshot.program_id.in_(list(hashes)),
+        PageSnapshot.content_hash.in_(list(set(hashes.values())))
+    ).all()
+    return {
+        program_id: json.loads(_decompress(chunks) or "[]")
+        for program_id, digest, chunks in rows
+        if hashes.get(program_id) == digest
+    }
+
+
+def load_content(program_id: int, digest: str = None) -> str:
+    """Page text of a program: the given snapshot or the most recently seen one"""
+    query = db.session.query(PageSnapshot.content).filter_by(program_id=program_id)
+    if digest:
+        query = query.filter_by(content_hash=digest)
+    row = query.order_by(PageSnapshot.last_seen_at.desc()).first()
+    return _decompress(row[0]) if row else ""
+
+
+def migrate_inline_content() -> int:
+    """Move page text stored inline in Program.curriculum_data into snapshots"""
+    from retrieval import chunk_text
+
+    moved = 0
+    for program in Program.query.all():
+        curriculum_data = program.curriculum_data or {}
+        if 'raw_content' not in curriculum_data and 'chunks' not in curriculum_data:
+            continue
+        content = curriculum_data.get('raw_content') or ""
+        chunks = curriculum_data.get('chunks')
+        if chunks is None:
+            chunks = chunk_text(content)
+        program.curriculum_data = {
+            'fetch_state': curriculum_data.get('fetch_state') or {},
+            'content_hash': store_snapshot(program.id, program.url, content, chunks)
+        }
+        moved += 1
+    if moved:
+        db.session.commit()
+        logger.info(f"Moved page content of {moved} programs into page snapshots")
+    return moved
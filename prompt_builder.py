@@ -0,0 +1,128 @@
+import os
+import re
+import math
+import logging
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+# Token budgets for the system prompt as a whole and for its variable sections
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "3500"))
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", "800"))
+# Previous bot answers are cut to this many tokens before they enter the history
+HISTORY_RESPONSE_TOKENS = int(os.environ.get("HISTORY_RESPONSE_TOKENS", "150"))
+
+_TOKEN_RE = re.compile(r"[A-Za-z]+|[0-9]{1,3}|[^\W\d_A-Za-z]+|[^\w\s]|\s+")
+
+
+def count_tokens(text: str) -> int:
+    """Approximate the GPT-4o token count of text without calling the API.
+
+    Follows the usual BPE rules of thumb: Latin words take about one token
+    per 4 characters, Cyrillic words one per 3, digits group by three and
+    every punctuation mark is a token. Whitespace is mostly merged into the
+    following token. Exact counts come back in the API usage and are
+    recorded by LLMClient.
+    """
+    if not text:
+        return 0
+    tokens = 0
+    for piece in _TOKEN_RE.findall(text):
+        if piece.isspace():
+            tokens += piece.count("\n") // 2
+        elif piece.isascii() and piece.isalpha():
+            tokens += math.ceil(len(piece) / 4)
+        elif piece.isalpha():
+            tokens += math.ceil(len(piece) / 3)
+        else:
+            tokens += 1
+    return tokens
+
+
+def truncate_to_tokens(text: str, budget: int, marker: str = "…") -> str:
+    """Cut text at a word boundary so that it fits into budget tokens"""
+    if count_tokens(text) <= budget:
+        return text
+    if budget <= 0:
+        return ""
+    # Start from a proportional cut and shrink until it fits
+    cut = int(len(text) * budget / count_tokens(text))
+    while cut > 0 and count_tokens(text[:cut]) + 1 > budget:
+        cut = int(cut * 0.9)
+    space = text.rfind(" ", 0, cut)
+    if space > cut // 2:
+        cut = space
+    return text[:cut].rstrip() + marker
+
+
+def fit_history(turns, budget: int = HISTORY_TOKEN_BUDGET,
+                response_tokens: int = HISTORY_RESPONSE_TOKENS) -> list:
+    """Shorten conversation turns (newest first) to fit into budget tokens.
+
+    Long bot answers are truncated first; if that is not enough the oldest
+    turns are dropped.
+    """
+    fitted = []
+    used = 0
+    for turn in turns:
+        message = truncate_to_tokens(turn.message or "", response_tokens)
+        response = truncate_to_tokens(turn.response or "", response_tokens)
+        cost = count_tokens(message) + count_tokens(response) + 6
+        if used + cost > budget:
+            break
+        fitted.append(SimpleNamespace(message=message, response=response))
+        used += cost
+    return fitted
+
+
+class PromptBuilder:
+    """Assembles a system prompt from titled sections under token budgets.
+
+    Each section may have its own budget; if the whole prompt is still over
+    total_budget, sections are shrunk in the order given by shrink_order.
+    """
+
+    def __init__(self, total_budget: int = PROMPT_TOKEN_BUDGET):
+        self.total_budget = total_budget
+        self._sections = []
+
+    def add(self, title: str, text: str, budget: int = None, shrink_order: int = None):
+        """Add a section; title may be empty for free-standing text"""
+        text = (text or "").strip()
+        if budget is not None:
+            text = truncate_to_tokens(text, budget)
+        self._sections.append({
+            'title': title,
+            'text': text,
+            'tokens': count_tokens(text),
+            'shrink_order': shrink_order
+        })
+        return self
+
+    def build(self) -> str:
+        overflow = self.total_tokens() - self.total_budget
+        shrinkable = sorted(
+            (section for section in self._sections if section['shrink_order'] is not None),
+            key=lambda section: section['shrink_order']
+        )
+        for section in shrinkable:
+            if overflow <= 0:
+                break
+            target = max(section['tokens'] - overflow, 0)
+            section['text'] = truncate_to_tokens(section['text'], target)
+            overflow -= section['tokens'] - count_tokens(section['text'])
+            section['tokens'] = count_tokens(section['text'])
+        if overflow > 0:
+            logger.warning(f"Prompt exceeds token budget by {overflow} tokens")
+
+        parts = []
+        for section in self._sections:
+            parts.append(f"{section['title']}:\n{section['text']}" if section['title'] else section['text'])
+        return "\n\n".join(parts)
+
+    def total_tokens(self) -> int:
+        return sum(section['tokens'] for section in self._sections)
+
+    def token_breakdown(self) -> dict:
+        """Tokens per section, for logging and accounting"""
+        return {section['title'] or 'intro': section['tokens'] for section in self._sections}
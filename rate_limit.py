@@ -0,0 +1,156 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from metrics import metrics, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Per-user token bucket for messages answered by the AI service: up to
+# RATE_LIMIT_BURST messages at once, refilled at RATE_LIMIT_PER_MINUTE (0 disables)
+RATE_LIMIT_PER_MINUTE = float(os.environ.get("RATE_LIMIT_PER_MINUTE", "10"))
+RATE_LIMIT_BURST = int(os.environ.get("RATE_LIMIT_BURST", "5"))
+RATE_LIMIT_USERS = 100000
+# AI-backed messages handled at once per process, how many more may wait for
+# a slot and for how long (seconds); the rest get a "busy" reply
+ADMISSION_MAX_ACTIVE = int(os.environ.get("ADMISSION_MAX_ACTIVE", "16"))
+ADMISSION_QUEUE_SIZE = int(os.environ.get("ADMISSION_QUEUE_SIZE", "100"))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "15"))
+
+RATE_LIMITED_MESSAGE = "⏳ Слишком много сообщений подряд. Подождите {seconds} сек. и задайте вопрос снова."
+BUSY_MESSAGE = "😔 Сейчас бот перегружен вопросами. Пожалуйста, повторите вопрос через минуту."
+
+ADMISSIONS = metrics.counter(
+    "bot_admissions_total", "AI-backed messages let through, by whether they waited in the queue (immediate or queued)"
+)
+SHED = metrics.counter(
+    "bot_shed_total", "Messages answered with a canned reply instead of the AI, by reason"
+)
+
+
+class Overloaded(Exception):
+    """The admission queue is full or the wait for a slot timed out"""
+
+
+class UserRateLimiter:
+    """Token bucket per Telegram user.
+
+    Buckets of the least recently seen users are forgotten beyond capacity;
+    such a user simply starts again with a full bucket. Buckets live in
+    process memory, so the limit only holds if all of a user's updates reach
+    one process: a single bot process, or bot_cluster workers, which pin
+    each user to a worker (BOT_WORKERS, webhook_server.py --partitions).
+    Independent bot instances behind a load balancer would each allow the
+    full rate.
+    """
+
+    def __init__(self, per_minute: float = RATE_LIMIT_PER_MINUTE, burst: int = RATE_LIMIT_BURST,
+                 capacity: int = RATE_LIMIT_USERS):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.capacity = capacity
+        self._buckets = OrderedDict()
+
+    def allow(self, user_id: str) -> bool:
+        """Take a token for the user's message; False if the bucket is empty"""
+        if self.rate <= 0:
+            return True
+        tokens = self._refill(user_id)
+        allowed = tokens >= 1
+        self._buckets[user_id] = (tokens - 1 if allowed else tokens, time.monotonic())
+        self._buckets.move_to_end(user_id)
+        while len(self._buckets) > self.capacity:
+            self._buckets.popitem(last=False)
+        if not allowed:
+            SHED.inc(reason='rate_limit')
+        return allowed
+
+    def retry_after(self, user_id: str) -> float:
+        """Seconds until the user has a token again"""
+        if self.rate <= 0:
+            return 0.0
+        return max(1 - self._refill(user_id), 0) / self.rate
+
+    def _refill(self, user_id: str) -> float:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            return float(self.burst)
+        tokens, updated = bucket
+        return min(self.burst, tokens + (time.monotonic() - updated) * self.rate)
+
+
+class AdmissionQueue:
+    """Bounded FIFO admission in front of the AI service.
+
+    At most max_active messages are processed at once; up to max_queue more
+    wait for a slot, each for at most timeout seconds. Anything beyond that
+    raises Overloaded immediately instead of growing the backlog. Used from
+    the bot's event loop only, so it does no locking.
+    """
+
+    def __init__(self, max_active: int = ADMISSION_MAX_ACTIVE, max_queue: int = ADMISSION_QUEUE_SIZE,
+                 timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.active = 0
+        self._waiters = deque()
+
+    @asynccontextmanager
+    async def admit(self):
+        """Hold a processing slot for the duration of the with-block"""
+        await self._acquire()
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self):
+        if self.active < self.max_active and not self._waiters:
+            self.active += 1
+            ADMISSIONS.inc(result='immediate')
+            return
+        if len(self._waiters) >= self.max_queue:
+            SHED.inc(reason='queue_full')
+            raise Overloaded(f"admission queue full ({len(self._waiters)} waiting)")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        started = time.perf_counter()
+        try:
+            # A released slot is handed over by resolving the waiter
+            await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            self._discard(waiter)
+            SHED.inc(reason='queue_timeout')
+            raise Overloaded(f"no free slot within {self.timeout}s")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            else:
+                self._discard(waiter)
+            raise
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage='admission_wait')
+        ADMISSIONS.inc(result='queued')
+
+    def _release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot passes to the waiter, so active stays the same
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def _discard(self, waiter):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+
+rate_limiter = UserRateLimiter()
+admission_queue = AdmissionQueue()
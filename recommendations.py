@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Pre-generated recommendations for the end of the survey.
+
+Survey answers (education, work experience, career goals) are classified
+into a small set of profile buckets. A batch job generates one
+recommendation per bucket for the current catalog version and stores it in
+the Recommendation table; the bot serves those instantly and only calls the
+model live for answers that do not fit any bucket.
+
+    python recommendations.py            # generate missing buckets
+    python recommendations.py --rebuild  # regenerate all buckets
+"""
+import os
+import re
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import itertools
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db
+from catalog import program_catalog
+from models import Recommendation
+
+logger = logging.getLogger(__name__)
+
+# Generate missing recommendations after every program data refresh
+RECOMMENDATION_MATRIX_ON_REFRESH = os.environ.get("RECOMMENDATION_MATRIX_ON_REFRESH", "1") == "1"
+# How long (seconds) loaded recommendations are kept before re-reading the table
+RECOMMENDATION_CACHE_TTL = float(os.environ.get("RECOMMENDATION_CACHE_TTL", "300"))
+# Recommendations generated at once by the matrix job, leaving LLM slots for live chat
+RECOMMENDATION_MATRIX_CONCURRENCY = int(os.environ.get("RECOMMENDATION_MATRIX_CONCURRENCY", "4"))
+
+# (bucket, description used in the generation prompt, pattern); first match wins
+EDUCATION_BUCKETS = (
+    ('math', 'математическое образование (математика, статистика)',
+     r'математ|статист|mathemat|statist'),
+    ('tech', 'техническое или IT-образование (информатика, программная инженерия)',
+     r'информат|программ|computer|software|\bit\b|\bит\b|инженер|технич|физи|радио|электрон|кибер|прикладн'),
+    ('business', 'экономическое или управленческое образование',
+     r'эконом|менеджм|управлен|бизнес|финанс|маркет|\bmba\b|business'),
+    ('humanities', 'гуманитарное образование',
+     r'гуманит|филолог|лингвист|юри|психолог|социолог|журналист|истор|педагог|дизайн|философ'),
+)
+EXPERIENCE_BUCKETS = (
+    ('none', 'нет опыта работы, только начинает карьеру'),
+    ('junior', 'опыт работы до 2 лет'),
+    ('senior', 'опыт работы 3 года и больше'),
+)
+GOAL_BUCKETS = (
+    ('research', 'исследователь в области ИИ, наука',
+     r'исследова|наук|research|phd|аспиран|учен'),
+    ('product', 'продакт-менеджер или руководитель ИИ-продуктов',
+     r'продакт|продукт|product|менедж|руковод|управл|стартап|предприним|основат|\bcto\b|\bceo\b'),
+    ('data', 'аналитик данных или data scientist',
+     r'аналит|\bdata\b|данны|scien'),
+    ('ml', 'ML-инженер или разработчик ИИ-систем',
+     r'\bml\b|машинн|инженер|разработ|develop|engineer|\bcv\b|\bnlp\b|зрени'),
+)
+
+_EDUCATION_RE = [(bucket, re.compile(pattern, re.IGNORECASE)) for bucket, _, pattern in EDUCATION_BUCKETS]
+_GOAL_RE = [(bucket, re.compile(pattern, re.IGNORECASE)) for bucket, _, pattern in GOAL_BUCKETS]
+_NO_EXPERIENCE_RE = re.compile(r'\bнет\b|без опыта|не работа|только начина|студент|выпускник|no experience|\b0\s*(лет|год)',
+                               re.IGNORECASE)
+_YEARS_RE = re.compile(r'(\d+(?:[.,]\d+)?)\s*(?:\+\s*)?(год|лет|year)', re.IGNORECASE)
+_JUNIOR_RE = re.compile(r'полгода|месяц|пару лет|год\b|стаж[её]р|junior|month', re.IGNORECASE)
+_SENIOR_RE = re.compile(r'много лет|более|больше|senior|lead|ведущ|руковод', re.IGNORECASE)
+
+
+def _classify_experience(text: str):
+    match = _YEARS_RE.search(text)
+    if match:
+        return 'junior' if float(match.group(1).replace(',', '.')) < 3 else 'senior'
+    if _NO_EXPERIENCE_RE.search(text):
+        return 'none'
+    if _SENIOR_RE.search(text):
+        return 'senior'
+    if _JUNIOR_RE.search(text):
+        return 'junior'
+    return None
+
+
+def classify_profile(education: str, work_experience: str, career_goals: str):
+    """Map survey answers to a bucket like "math|junior|ml", or None for outliers"""
+    education_bucket = next(
+        (bucket for bucket, pattern in _EDUCATION_RE if pattern.search(education or '')), None
+    )
+    experience_bucket = _classify_experience(work_experience or '')
+    goal_bucket = next(
+        (bucket for bucket, pattern in _GOAL_RE if pattern.search(career_goals or '')), None
+    )
+    if not (education_bucket and experience_bucket and goal_bucket):
+        return None
+    return f"{education_bucket}|{experience_bucket}|{goal_bucket}"
+
+
+def all_buckets() -> list:
+    return [
+        f"{education}|{experience}|{goal}"
+        for (education, *_), (experience, _), (goal, *_) in itertools.product(
+            EDUCATION_BUCKETS, EXPERIENCE_BUCKETS, GOAL_BUCKETS
+        )
+    ]
+
+
+def describe_bucket(bucket: str) -> tuple:
+    """(education, work experience, career goals) texts representing a bucket"""
+    education, experience, goal = bucket.split('|')
+    return (
+        next(text for name, text, _ in EDUCATION_BUCKETS if name == education),
+        next(text for name, text in EXPERIENCE_BUCKETS if name == experience),
+        next(text for name, text, _ in GOAL_BUCKETS if name == goal)
+    )
+
+
+class RecommendationMatrix:
+    """Read-through cache of the Recommendation table for the current catalog"""
+
+    def __init__(self, ttl: float = RECOMMENDATION_CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._version = None
+        self._loaded_at = 0.0
+        self._texts = {}
+
+    def get(self, bucket: str, catalog_version: str):
+        """Return the stored recommendation for bucket, or None"""
+        if catalog_version != self._version or time.monotonic() - self._loaded_at > self.ttl:
+            self._texts = {
+                row.bucket: row.text
+                for row in Recommendation.query.filter_by(catalog_version=catalog_version).all()
+            }
+            self._version = catalog_version
+            self._loaded_at = time.monotonic()
+
+        text = self._texts.get(bucket)
+        if text is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return text
+
+    def invalidate(self):
+        self._version = None
+
+
+recommendation_matrix = RecommendationMatrix()
+
+
+async def build_recommendation_matrix(ai_service=None, rebuild: bool = False) -> dict:
+    """Generate recommendations for every bucket missing for the current catalog.
+
+    At most RECOMMENDATION_MATRIX_CONCURRENCY requests run at once; they are
+    batch LLM calls, so waiting for a slot does not eat into their deadline
+    and their failures do not open the circuit breaker used by live chat.
+    Rows for older catalog versions are deleted. Must run in an app context.
+    """
+    if ai_service is None:
+        from ai_service import AIService
+        ai_service = AIService()
+
+    catalog = program_catalog.get()
+    if not catalog.programs:
+        return {'skipped': 'no programs'}
+
+    if rebuild:
+        Recommendation.query.filter_by(catalog_version=catalog.version).delete()
+        db.session.commit()
+    existing = {
+        row.bucket for row in Recommendation.query.filter_by(catalog_version=catalog.version).all()
+    }
+    missing = [bucket for bucket in all_buckets() if bucket not in existing]
+
+    semaphore = asyncio.Semaphore(RECOMMENDATION_MATRIX_CONCURRENCY)
+
+    async def generate(bucket: str):
+        try:
+            async with semaphore:
+                return bucket, await ai_service.request_recommendation(*describe_bucket(bucket), batch=True)
+        except Exception as e:
+            logger.error(f"Error generating recommendation for bucket {bucket}: {e}")
+            return bucket, None
+
+    results = await asyncio.gather(*(generate(bucket) for bucket in missing))
+    generated = [(bucket, text) for bucket, text in results if text]
+    for bucket, text in generated:
+        db.session.add(Recommendation(bucket=bucket, catalog_version=catalog.version, text=text))
+    Recommendation.query.filter(Recommendation.catalog_version != catalog.version).delete()
+    db.session.commit()
+    recommendation_matrix.invalidate()
+
+    summary = {
+        'version': catalog.version,
+        'generated': len(generated),
+        'existing': len(existing),
+        'failed': len(missing) - len(generated)
+    }
+    logger.info(f"Recommendation matrix updated: {summary}")
+    return summary
+
+
+def refresh_recommendation_matrix(rebuild: bool = False) -> dict:
+    """Synchronous entry point for jobs and the command line"""
+    with app.app_context():
+        return asyncio.run(build_recommendation_matrix(rebuild=rebuild))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rebuild', action='store_true', help='regenerate existing recommendations too')
+    args = parser.parse_args()
+    print(refresh_recommendation_matrix(rebuild=args.rebuild))
@@ -0,0 +1,169 @@
+import os
+import re
+import math
+import time
+import logging
+import threading
+from collections import Counter
+from app import app, db
+from models import Conversation
+from retrieval import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Minimum probability of the local classifier for a message to reach the LLM
+RELEVANCE_THRESHOLD = float(os.environ.get("RELEVANCE_THRESHOLD", "0.5"))
+# How many recent conversations to learn from and how often to retrain (seconds)
+RELEVANCE_TRAINING_LIMIT = int(os.environ.get("RELEVANCE_TRAINING_LIMIT", "5000"))
+RELEVANCE_RETRAIN_INTERVAL = float(os.environ.get("RELEVANCE_RETRAIN_INTERVAL", "3600"))
+
+# Word stems that make a message relevant on their own; matched at word start
+RELEVANT_STEMS = (
+    'итмо', 'itmo', 'магистр', 'программ', 'искусствен', 'интеллект', 'нейросет',
+    'машинн', 'обучени', 'поступ', 'абитуриент', 'экзамен', 'вступительн', 'бюджет',
+    'контракт', 'стоимост', 'оплат', 'стипенди', 'общежити', 'карьер', 'трудоустр',
+    'ваканси', 'выпускник', 'курс', 'дисциплин', 'предмет', 'учебн', 'семестр',
+    'преподавател', 'партнер', 'партнёр', 'длительност', 'требовани', 'документ',
+    'диплом', 'портфолио', 'собеседовани', 'олимпиад', 'data scien', 'product',
+    'продакт', 'заняти', 'расписани',
+)
+# Short terms that only count as whole words ("ai" inside "said" does not)
+RELEVANT_WORDS = ('ai', 'ml', 'ии', 'ds', 'llm', 'nlp', 'cv')
+
+_RELEVANT_RE = re.compile(
+    r"\b(?:" + "|".join(re.escape(stem) for stem in RELEVANT_STEMS) + r")"
+    r"|\b(?:" + "|".join(RELEVANT_WORDS) + r")\b",
+    re.IGNORECASE
+)
+
+# Bootstrap examples so the classifier works before there is any history
+SEED_EXAMPLES = (
+    ("Какие предметы изучают на первом курсе?", True),
+    ("Сколько бюджетных мест в этом году?", True),
+    ("Чем отличаются две программы?", True),
+    ("Какие есть карьерные перспективы после выпуска?", True),
+    ("Можно ли учиться и работать одновременно?", True),
+    ("Нужно ли знать английский для поступления?", True),
+    ("Какие документы подавать и до какого срока?", True),
+    ("Где проходят занятия и какое расписание?", True),
+    ("Подойдет ли мне программа, если я аналитик?", True),
+    ("Есть ли онлайн формат обучения?", True),
+    ("Какая погода будет завтра?", False),
+    ("Расскажи анекдот", False),
+    ("Напиши мне код на питоне для сортировки", False),
+    ("Кто выиграл вчерашний матч?", False),
+    ("Посоветуй фильм на вечер", False),
+    ("Как приготовить борщ?", False),
+    ("Привет, как дела?", False),
+    ("Реши задачу по физике", False),
+    ("Переведи текст на английский", False),
+    ("Сколько сейчас стоит биткоин?", False),
+)
+
+
+def has_relevant_terms(message: str) -> bool:
+    """Single compiled-regex scan for program-related stems"""
+    return _RELEVANT_RE.search(message) is not None
+
+
+class RelevanceClassifier:
+    """Gate in front of LLM calls: stem matcher plus a naive Bayes fallback.
+
+    The classifier learns from logged conversations the LLM answered:
+    replies that start with the off-topic marker are negatives, other
+    answers are positives. Messages rejected by the gate itself (answered
+    with gated_reply) are left out, so its mistakes are not learned back.
+    Training runs in a background thread, at most every retrain_interval
+    seconds; until it finishes the previous model is used.
+    """
+
+    def __init__(self, off_topic_marker: str, gated_reply: str = None, ignored_markers: tuple = (),
+                 threshold: float = RELEVANCE_THRESHOLD,
+                 retrain_interval: float = RELEVANCE_RETRAIN_INTERVAL):
+        self.off_topic_marker = off_topic_marker
+        self.gated_reply = gated_reply
+        # Responses that are not answers to questions (survey steps, etc.)
+        self.ignored_markers = ignored_markers
+        self.threshold = threshold
+        self.retrain_interval = retrain_interval
+        self._trained_at = None
+        self._training = False
+        self._fit(SEED_EXAMPLES)
+
+    def is_relevant(self, message: str) -> bool:
+        if has_relevant_terms(message):
+            return True
+        self.retrain_in_background()
+        return self.probability(message) >= self.threshold
+
+    def probability(self, message: str) -> float:
+        """P(relevant | message) under the naive Bayes model"""
+        terms = tokenize(message)
+        if not terms:
+            return 0.0
+        # One reference, so a model swapped in by the training thread is used whole
+        term_counts, term_totals, vocabulary, log_priors = self._model
+        scores = {}
+        for label in (True, False):
+            counts = term_counts[label]
+            total = term_totals[label] + len(vocabulary) + 1
+            score = log_priors[label]
+            for term in terms:
+                score += math.log((counts.get(term, 0) + 1) / total)
+            scores[label] = score
+        # Normalise in log space to avoid underflow on long messages
+        diff = scores[False] - scores[True]
+        return 1.0 / (1.0 + math.exp(min(diff, 700)))
+
+    def train_from_history(self, limit: int = RELEVANCE_TRAINING_LIMIT) -> int:
+        """Retrain on the seed examples plus recent conversations; returns the sample count"""
+        marker_length = max(len(marker) for marker in (self.off_topic_marker, *self.ignored_markers)) + 10
+        query = db.session.query(Conversation.message, db.func.substr(Conversation.response, 1, marker_length))
+        if self.gated_reply:
+            query = query.filter(Conversation.response != self.gated_reply)
+        rows = query.order_by(Conversation.created_at.desc()).limit(limit).all()
+
+        examples = list(SEED_EXAMPLES)
+        for message, response in rows:
+            response = (response or "").strip()
+            if not message or message.startswith('/') or not response:
+                continue
+            if any(response.startswith(marker) for marker in self.ignored_markers):
+                continue
+            examples.append((message, not response.startswith(self.off_topic_marker)))
+        self._fit(examples)
+        self._trained_at = time.monotonic()
+        logger.info(f"Relevance classifier trained on {len(examples)} messages")
+        return len(examples)
+
+    def retrain_in_background(self):
+        """Start retraining in a thread if the model is due; never blocks the caller"""
+        if self._training:
+            return
+        if self._trained_at is not None and time.monotonic() - self._trained_at < self.retrain_interval:
+            return
+        self._training = True
+        threading.Thread(target=self._train, name="relevance-training", daemon=True).start()
+
+    def _train(self):
+        try:
+            with app.app_context():
+                self.train_from_history()
+        except Exception as e:
+            # Keep the previous model; try again after the interval
+            self._trained_at = time.monotonic()
+            logger.error(f"Error training relevance classifier: {e}")
+        finally:
+            self._training = False
+
+    def _fit(self, examples):
+        term_counts = {True: Counter(), False: Counter()}
+        documents = Counter()
+        for message, label in examples:
+            term_counts[label].update(tokenize(message))
+            documents[label] += 1
+        term_totals = {label: sum(counts.values()) for label, counts in term_counts.items()}
+        vocabulary = set(term_counts[True]) | set(term_counts[False])
+        total = sum(documents.values())
+        log_priors = {label: math.log((documents[label] + 1) / (total + 2)) for label in (True, False)}
+        self._model = (term_counts, term_totals, vocabulary, log_priors)
@@ -0,0 +1,60 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from metrics import metrics
+
+# Number of cached answers and how long (seconds) each one stays valid
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "1000"))
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "3600"))
+
+CACHE_LOOKUPS = metrics.counter("response_cache_lookups_total", "AI answer cache lookups by result (hit or miss)")
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]+")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_message(message: str) -> str:
+    """Normalize a user message so trivially different spellings share a key"""
+    text = message.lower().replace('ё', 'е')
+    text = _PUNCTUATION_RE.sub(' ', text)
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+class ResponseCache:
+    """Thread-safe LRU cache of AI answers with per-entry expiry"""
+
+    def __init__(self, max_size: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(message: str, catalog_version: str, profile_bucket: str) -> tuple:
+        return (normalize_message(message), catalog_version, profile_bucket or 'unknown')
+
+    def get(self, key):
+        """Return the cached answer for key, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                CACHE_LOOKUPS.inc(result='miss')
+                return None
+            self._entries.move_to_end(key)
+            CACHE_LOOKUPS.inc(result='hit')
+            return entry[1]
+
+    def set(self, key, value: str):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
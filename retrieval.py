@@ -0,0 +1,106 @@
+import os
+import re
+import math
+from collections import Counter
+from prompt_builder import count_tokens
+
+# Number of chunks to put into a prompt and the hard token budget for them
+RETRIEVAL_TOP_K = int(os.environ.get("RETRIEVAL_TOP_K", "5"))
+RETRIEVAL_TOKEN_BUDGET = int(os.environ.get("RETRIEVAL_TOKEN_BUDGET", "1500"))
+# Target chunk size in characters
+CHUNK_SIZE = 800
+
+_WORD_RE = re.compile(r"[a-zа-яё0-9]+")
+_RU_ENDING_RE = re.compile(
+    r"(ами|ями|ого|его|ому|ему|ыми|ими|ых|их|ая|яя|ое|ее|ые|ие|ой|ей|ий|ый|ом|ем|ам|ям|ах|ях|"
+    r"ов|ев|ть|ет|ут|ют|ит|ат|ят|а|я|о|е|ы|и|у|ю|ь)$"
+)
+
+
+def tokenize(text: str) -> list:
+    """Lowercase, split into words and strip common Russian endings"""
+    terms = []
+    for word in _WORD_RE.findall(text.lower().replace('ё', 'е')):
+        if len(word) > 4 and not word.isascii():
+            word = _RU_ENDING_RE.sub('', word)
+        terms.append(word)
+    return terms
+
+
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE) -> list:
+    """Split page text into paragraph-aligned chunks of about chunk_size chars"""
+    chunks = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n|\n", text or ""):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) + 1 > chunk_size:
+            chunks.append(current)
+            current = ""
+        # Oversized paragraphs are cut on sentence boundaries
+        while len(paragraph) > chunk_size:
+            cut = paragraph.rfind('. ', 0, chunk_size)
+            cut = cut + 1 if cut > 0 else chunk_size
+            chunks.append(paragraph[:cut].strip())
+            paragraph = paragraph[cut:].strip()
+        current = f"{current}\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class RetrievalIndex:
+    """BM25 index over program page chunks"""
+
+    def __init__(self, documents: list, k1: float = 1.5, b: float = 0.75):
+        # documents: list of (program_name, chunk_text)
+        self.documents = documents
+        self.k1 = k1
+        self.b = b
+        self._term_freqs = [Counter(tokenize(text)) for _, text in documents]
+        self._lengths = [sum(freqs.values()) for freqs in self._term_freqs]
+        self._avg_length = sum(self._lengths) / len(self._lengths) if self._lengths else 0.0
+
+        doc_freqs = Counter()
+        for freqs in self._term_freqs:
+            doc_freqs.update(freqs.keys())
+        total = len(documents)
+        self._idf = {
+            term: math.log(1 + (total - freq + 0.5) / (freq + 0.5))
+            for term, freq in doc_freqs.items()
+        }
+
+    def search(self, query: str, top_k: int = RETRIEVAL_TOP_K) -> list:
+        """Return up to top_k (score, program_name, chunk_text) tuples"""
+        terms = [term for term in set(tokenize(query)) if term in self._idf]
+        if not terms:
+            return []
+
+        scored = []
+        for i, freqs in enumerate(self._term_freqs):
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[i] / self._avg_length)
+            score = 0.0
+            for term in terms:
+                tf = freqs.get(term)
+                if tf:
+                    score += self._idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            if score > 0:
+                scored.append((score, i))
+
+        scored.sort(reverse=True)
+        return [(score, *self.documents[i]) for score, i in scored[:top_k]]
+
+    def format_context(self, query: str, top_k: int = RETRIEVAL_TOP_K,
+                       token_budget: int = RETRIEVAL_TOKEN_BUDGET) -> str:
+        """Render the most relevant chunks for query within token_budget"""
+        parts = []
+        used = 0
+        for _, program_name, text in self.search(query, top_k):
+            part = f"[{program_name}]\n{text}"
+            cost = count_tokens(part)
+            if used + cost > token_budget:
+                continue
+            parts.append(part)
+            used += cost
+        return "\n\n".join(parts) if parts else "Релевантных фрагментов не найдено."
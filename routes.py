@@ -1,11 +1,20 @@
-from flask import render_template, jsonify, request
+from flask import Response, render_template, jsonify, request
 from app import app, db
 from models import Conversation, UserProfile, Program
+from catalog import program_catalog
+from metrics import metrics
 from datetime import datetime, timedelta
+import os
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+# /api/stats payloads are cached per range for this many seconds
+STATS_CACHE_TTL = float(os.environ.get("STATS_CACHE_TTL", "60"))
+STATS_MAX_DAYS = 366
+_stats_cache = {}
+
 @app.route('/')
 def dashboard():
     """Main dashboard for bot management"""
@@ -47,23 +56,30 @@ def dashboard():
 def api_stats():
     """API endpoint for getting bot statistics"""
     try:
-        # Get conversation stats for the last 7 days
-        week_ago = datetime.utcnow() - timedelta(days=7)
-        daily_stats = []
+        days = min(max(request.args.get('days', 7, type=int), 1), STATS_MAX_DAYS)
         
-        for i in range(7):
-            day = week_ago + timedelta(days=i)
-            day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
-            day_end = day_start + timedelta(days=1)
-            
-            count = Conversation.query.filter(
-                Conversation.created_at >= day_start,
-                Conversation.created_at < day_end
-            ).count()
-            
+        cached = _stats_cache.get(days)
+        if cached and time.monotonic() - cached[0] < STATS_CACHE_TTL:
+            return jsonify(cached[1])
+        
+        # Conversation counts per day for the requested range, in one query
+        today = datetime.utcnow().date()
+        first_day = today - timedelta(days=days - 1)
+        day_column = db.func.date(Conversation.created_at)
+        daily_counts = db.session.query(
+            day_column,
+            db.func.count(Conversation.id)
+        ).filter(
+            Conversation.created_at >= datetime.combine(first_day, datetime.min.time())
+        ).group_by(day_column).all()
+        
+        counts_by_day = {str(day): count for day, count in daily_counts}
+        daily_stats = []
+        for i in range(days):
+            day = (first_day + timedelta(days=i)).strftime('%Y-%m-%d')
             daily_stats.append({
-                'date': day.strftime('%Y-%m-%d'),
-                'conversations': count
+                'date': day,
+                'conversations': counts_by_day.get(day, 0)
             })
         
         # Get user backgrounds distribution
@@ -77,11 +93,13 @@ def api_stats():
             for bg in backgrounds
         ]
         
-        return jsonify({
+        payload = {
             'daily_conversations': daily_stats,
             'user_backgrounds': background_stats,
             'status': 'success'
-        })
+        }
+        _stats_cache[days] = (time.monotonic(), payload)
+        return jsonify(payload)
         
     except Exception as e:
         logger.error(f"Error getting stats: {e}")
@@ -91,7 +109,7 @@ def api_stats():
 def api_programs():
     """API endpoint for getting program information"""
     try:
-        programs = Program.query.all()
+        programs = program_catalog.get().programs
         programs_data = []
         
         for program in programs:
@@ -150,13 +168,47 @@ def api_conversations():
         logger.error(f"Error getting conversations: {e}")
         return jsonify({'status': 'error', 'message': str(e)})
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Latency histograms and counters of all bot and web processes in Prometheus text format"""
+    return Response(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/metrics')
+def api_metrics():
+    """Metrics summary for the dashboard: counts, mean and p50/p95 per stage"""
+    try:
+        return jsonify({'metrics': metrics.summary(), 'status': 'success'})
+    except Exception as e:
+        logger.error(f"Error collecting metrics: {e}")
+        return jsonify({'status': 'error', 'message': str(e)})
+
 @app.route('/refresh-data', methods=['POST'])
 def refresh_data():
-    """Manually refresh program data"""
+    """Queue a program data refresh and return its job id"""
     try:
-        from web_scraper import scrape_and_store_program_data
-        scrape_and_store_program_data()
-        return jsonify({'status': 'success', 'message': 'Данные обновлены'})
+        from jobs import refresh_jobs
+        job = refresh_jobs.enqueue()
+        return jsonify({
+            'status': 'success',
+            'message': 'Обновление данных запущено',
+            'job_id': job['id'],
+            'job': job
+        }), 202
     except Exception as e:
-        logger.error(f"Error refreshing data: {e}")
+        logger.error(f"Error queueing data refresh: {e}")
         return jsonify({'status': 'error', 'message': str(e)})
+
+@app.route('/refresh-data/status')
+def refresh_status():
+    """Current and last finished program data refresh"""
+    from jobs import refresh_jobs
+    return jsonify({'status': 'success', **refresh_jobs.status()})
+
+@app.route('/refresh-data/<job_id>')
+def refresh_job(job_id):
+    """Status of a single program data refresh job"""
+    from jobs import refresh_jobs
+    job = refresh_jobs.get(job_id)
+    if not job:
+        return jsonify({'status': 'error', 'message': 'Задача не найдена'}), 404
+    return jsonify({'status': 'success', 'job': job})
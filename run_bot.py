@@ -13,6 +13,7 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 # Import after path setup
 from app import app
 from telegram_bot import setup_bot, run_bot
+from bot_cluster import BOT_WORKERS, BotCluster, setup_forwarding_bot
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -29,6 +30,16 @@ def main():
         return
     
     try:
+        if BOT_WORKERS > 1:
+            # Poll in this process, handle updates in worker processes partitioned by user
+            cluster = BotCluster(BOT_WORKERS)
+            cluster.start()
+            try:
+                run_bot(setup_forwarding_bot(cluster))
+            finally:
+                cluster.stop()
+            return
+        
         # Setup and run bot with Flask app context
         with app.app_context():
             bot = setup_bot()
@@ -1,15 +1,44 @@
 import os
+import time
+import asyncio
 import logging
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from ai_service import AIService
-from models import Conversation, UserProfile, Program
-from app import db, app
+from telegram.error import BadRequest, RetryAfter
+from telegram.ext import Application, BaseUpdateProcessor, CommandHandler, MessageHandler, filters, ContextTypes
+from ai_service import AIService, PreparedResponse, ERROR_MESSAGE
+from fallback_answers import ADMISSION_INFO, CAREER_INFO
+from catalog import program_catalog
+from conversation_log import conversation_logger
+from user_sessions import session_store
+from models import UserProfile
+from metrics import metrics, STAGE_SECONDS
+from rate_limit import BUSY_MESSAGE, RATE_LIMITED_MESSAGE, Overloaded, admission_queue, rate_limiter
+from app import app
 
 logger = logging.getLogger(__name__)
 
 # Get Telegram Bot Token from environment
 TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "your-bot-token-here").strip()
+# Alternative Bot API server, e.g. a local fake for testing
+TELEGRAM_API_BASE_URL = os.environ.get("TELEGRAM_API_BASE_URL", "")
+# Updates handled at once by one bot process; each user's updates still run in order
+BOT_CONCURRENT_UPDATES = int(os.environ.get("BOT_CONCURRENT_UPDATES", "32"))
+
+# Streaming replies: edit the placeholder at most once per interval and only
+# when enough new text has arrived, to stay within Telegram edit limits
+STREAM_RESPONSES = os.environ.get("STREAM_RESPONSES", "1") == "1"
+STREAM_EDIT_INTERVAL = float(os.environ.get("STREAM_EDIT_INTERVAL", "1.5"))
+STREAM_MIN_CHARS = int(os.environ.get("STREAM_MIN_CHARS", "40"))
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Keyboard buttons answered locally, without the AI service
+PROFILE_BUTTONS = ["👤 Мой профиль", "Мой профиль"]
+COMPARE_BUTTONS = ["📊 Сравнить программы", "Сравнить программы"]
+ASK_BUTTONS = ["❓ Задать вопрос", "Задать вопрос"]
+
+MESSAGE_SECONDS = metrics.histogram(
+    "bot_message_seconds", "Total time to handle a Telegram text message by kind"
+)
 
 class ITMOBot:
     def __init__(self):
@@ -92,29 +121,62 @@ class ITMOBot:
         user = update.effective_user
         message_text = update.message.text
         
-        with app.app_context():
-            # Check if it's a profile update
-            if self._is_profile_update(message_text):
-                response = self._update_user_profile(str(user.id), user.username or "", message_text)
-                await update.message.reply_text(response)
-                self._save_conversation(str(user.id), user.username or "", message_text, response)
-                return
-            
-            # Handle predefined buttons
-            if message_text in ["📝 Начать опрос", "Начать опрос"]:
-                # Reset user survey to start over
-                with app.app_context():
-                    user_profile = UserProfile.query.filter_by(telegram_user_id=str(user.id)).first()
-                    if user_profile:
-                        user_profile.survey_step = 0
-                        db.session.commit()
-                response = await self.ai_service.generate_response("начать опрос", str(user.id))
-            elif message_text in ["📊 Сравнить программы", "Сравнить программы"]:
-                response = self._compare_programs()
-            elif message_text in ["👤 Мой профиль", "Мой профиль"]:
-                response = self._get_user_profile(str(user.id))
-            elif message_text in ["❓ Задать вопрос", "Задать вопрос"]:
-                response = """
+        started = time.perf_counter()
+        kind = 'error'
+        try:
+            with app.app_context():
+                if self._needs_ai(message_text):
+                    kind = await self._handle_admitted(update, user, message_text)
+                else:
+                    kind = await self._handle_text(update, user, message_text)
+        finally:
+            MESSAGE_SECONDS.observe(time.perf_counter() - started, kind=kind)
+
+    def _needs_ai(self, message_text: str) -> bool:
+        """Whether the message is answered by the AI service (survey or free question)"""
+        return not (
+            self._is_profile_update(message_text)
+            or message_text in PROFILE_BUTTONS + COMPARE_BUTTONS + ASK_BUTTONS
+        )
+
+    async def _handle_admitted(self, update: Update, user, message_text: str) -> str:
+        """Pass an AI-backed message through the user's rate limit and the admission queue"""
+        user_id = str(user.id)
+        if not rate_limiter.allow(user_id):
+            seconds = max(round(rate_limiter.retry_after(user_id)), 1)
+            logger.info(f"Rate limited user {user_id} for {seconds}s")
+            await self._reply(update, RATE_LIMITED_MESSAGE.format(seconds=seconds))
+            return 'rate_limited'
+        try:
+            async with admission_queue.admit():
+                return await self._handle_text(update, user, message_text)
+        except Overloaded as e:
+            # Shed replies are not saved: they would only clutter the history
+            logger.warning(f"Shedding message from user {user_id}: {e}")
+            await self._reply(update, BUSY_MESSAGE)
+            return 'shed'
+
+    async def _handle_text(self, update: Update, user, message_text: str) -> str:
+        """Answer a text message; returns its kind for the latency metrics"""
+        # Check if it's a profile update
+        if self._is_profile_update(message_text):
+            response = self._update_user_profile(str(user.id), user.username or "", message_text)
+            await self._reply(update, response)
+            self._save_conversation(str(user.id), user.username or "", message_text, response)
+            return 'profile_update'
+        
+        kind = 'button'
+        # Handle predefined buttons
+        if message_text in ["📝 Начать опрос", "Начать опрос"]:
+            # Reset user survey to start over
+            session_store.update_profile(str(user.id), survey_step=0)
+            response = await self.ai_service.generate_response("начать опрос", str(user.id))
+        elif message_text in COMPARE_BUTTONS:
+            response = self._compare_programs()
+        elif message_text in PROFILE_BUTTONS:
+            response = self._get_user_profile(str(user.id))
+        elif message_text in ASK_BUTTONS:
+            response = """
 💡 Задайте любой вопрос о программах ИТМО в области ИИ:
 
 • Содержание курсов и дисциплины
@@ -125,13 +187,70 @@ class ITMOBot:
 • Преподаватели и партнеры
 
 Просто напишите ваш вопрос!
-                """
-            else:
-                # Use AI service for general questions
-                response = await self.ai_service.generate_response(message_text, str(user.id))
-            
-            await update.message.reply_text(response)
+            """
+        elif STREAM_RESPONSES:
+            # Stream AI answers for general questions into an edited message
+            response = await self._reply_streaming(update, message_text, str(user.id))
             self._save_conversation(str(user.id), user.username or "", message_text, response)
+            return 'question'
+        else:
+            # Use AI service for general questions
+            kind = 'question'
+            response = await self.ai_service.generate_response(message_text, str(user.id))
+        
+        await self._reply(update, response)
+        self._save_conversation(str(user.id), user.username or "", message_text, response)
+        return kind
+
+    async def _reply(self, update: Update, text: str):
+        with STAGE_SECONDS.time(stage='reply'):
+            return await update.message.reply_text(text)
+
+    async def _reply_streaming(self, update: Update, message_text: str, user_id: str) -> str:
+        """Reply with a placeholder and edit it as the AI answer streams in"""
+        try:
+            prepared = await self.ai_service.prepare_response(message_text, user_id)
+        except Exception as e:
+            logger.error(f"Error preparing AI response: {e}")
+            prepared = PreparedResponse(text=ERROR_MESSAGE)
+        
+        if prepared.text is not None:
+            # Survey steps, off-topic and cached answers need no streaming
+            await self._reply(update, prepared.text)
+            return prepared.text
+        
+        placeholder = await self._reply(update, "✍️ Готовлю ответ...")
+        response = ""
+        shown = ""
+        last_edit = time.monotonic()
+        
+        async for delta in self.ai_service.stream_response(prepared):
+            response += delta
+            now = time.monotonic()
+            if now - last_edit >= STREAM_EDIT_INTERVAL and len(response) - len(shown) >= STREAM_MIN_CHARS:
+                shown = response[:TELEGRAM_MESSAGE_LIMIT]
+                last_edit = now
+                await self._edit_message(placeholder, shown)
+        
+        # Final edit with the complete text; overflow goes into extra messages
+        if response[:TELEGRAM_MESSAGE_LIMIT] != shown:
+            await self._edit_message(placeholder, response[:TELEGRAM_MESSAGE_LIMIT])
+        for start in range(TELEGRAM_MESSAGE_LIMIT, len(response), TELEGRAM_MESSAGE_LIMIT):
+            await update.message.reply_text(response[start:start + TELEGRAM_MESSAGE_LIMIT])
+        
+        return response
+
+    async def _edit_message(self, message, text: str):
+        """Edit a bot message, tolerating Telegram flood limits"""
+        try:
+            with STAGE_SECONDS.time(stage='edit'):
+                await message.edit_text(text)
+        except RetryAfter as e:
+            # Skip this update; the next edit (or the final one) catches up
+            logger.warning(f"Telegram edit rate limit hit, retry after {e.retry_after}s")
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                logger.error(f"Error editing message: {e}")
 
     def _is_profile_update(self, message: str) -> bool:
         """Check if message is a profile update"""
@@ -157,22 +276,13 @@ class ITMOBot:
             interests = [interest.strip() for interest in parts[2:]]
             
             # Find or create user profile
-            profile = UserProfile.query.filter_by(telegram_user_id=str(user_id)).first()
-            if profile:
-                profile.background = background
-                profile.experience_years = experience_years
-                profile.interests = interests
-                profile.username = username
-            else:
-                profile = UserProfile()
-                profile.telegram_user_id = str(user_id)
-                profile.username = username
-                profile.background = background
-                profile.experience_years = experience_years
-                profile.interests = interests
-                db.session.add(profile)
-            
-            db.session.commit()
+            profile = session_store.update_profile(
+                str(user_id),
+                background=background,
+                experience_years=experience_years,
+                interests=interests,
+                username=username
+            )
             
             # Generate personalized recommendation
             recommendation = self._generate_personalized_recommendation(profile)
@@ -247,7 +357,7 @@ class ITMOBot:
     def _compare_programs(self) -> str:
         """Compare both AI programs"""
         try:
-            programs = Program.query.all()
+            programs = program_catalog.get().programs
             if len(programs) < 2:
                 return "Данные о программах загружаются. Попробуйте позже."
             
@@ -283,7 +393,7 @@ class ITMOBot:
     def _get_user_profile(self, user_id: str) -> str:
         """Get user profile information"""
         try:
-            profile = UserProfile.query.filter_by(telegram_user_id=str(user_id)).first()
+            profile = session_store.get(str(user_id), create=False).profile
             if not profile:
                 return "Профиль не найден. Используйте /profile для создания."
             
@@ -304,64 +414,84 @@ class ITMOBot:
 
     def _get_career_info(self) -> str:
         """Get career information"""
-        return """
-💼 Карьерные перспективы:
-
-**Искусственный интеллект:**
-• ML Engineer: 170,000 - 300,000+ ₽
-• Data Engineer: 150,000 - 280,000 ₽  
-• Data Scientist: 180,000 - 350,000 ₽
-• Компании: Яндекс, Сбер, МТС, X5 Group
-
-**Управление ИИ-продуктами:**
-• AI Product Manager: 150,000 - 400,000+ ₽
-• AI Project Manager: 120,000 - 300,000 ₽
-• AI Product Analyst: 100,000 - 250,000 ₽
-• Компании: Альфа-Банк, стартапы, техкорпорации
-
-Спрос на AI-специалистов растет на 40% в год!
-        """
+        return CAREER_INFO
 
     def _get_admission_info(self) -> str:
         """Get admission information"""
-        return """
-📝 Как поступить:
-
-**Способы поступления:**
-1. Вступительные экзамены (дистанционно)
-2. Junior ML Contest (без экзаменов)
-3. Конкурс "Портфолио" ИТМО (85+ баллов)
-4. МегаОлимпиада ИТМО
-5. Олимпиада "Я-профессионал"
-6. Рекомендательное письмо
-
-**Ближайшие экзамены:**
-• 05.08.2025, 04:00
-• 07.08.2025, 04:00  
-• 12.08.2025, 04:00
-
-**Документы:** https://abitlk.itmo.ru/
-**Подробнее:** https://abit.itmo.ru/programs/master
-        """
+        return ADMISSION_INFO
 
     def _save_conversation(self, user_id: str, username: str, message: str, response: str):
-        """Save conversation to database"""
+        """Queue conversation for a batched write to the database"""
         try:
-            conversation = Conversation()
-            conversation.telegram_user_id = user_id
-            conversation.username = username  
-            conversation.message = message
-            conversation.response = response
-            db.session.add(conversation)
-            db.session.commit()
+            conversation_logger.log(user_id, username, message, response)
+            session_store.add_turn(user_id, message, response)
         except Exception as e:
             logger.error(f"Error saving conversation: {e}")
 
-def setup_bot():
+class UserOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates of different users concurrently and each user's in order.
+
+    Updates of one user wait on a per-user lock; the locks are taken in the
+    order the updates arrive, so a survey answer is never handled before the
+    previous one. A concurrency slot is only taken once an update holds its
+    user's lock, so a burst from one user cannot occupy the slots of others
+    (as in bot_cluster._consume). Updates without a user are not serialized.
+    """
+
+    def __init__(self, max_concurrent_updates: int = BOT_CONCURRENT_UPDATES):
+        super().__init__(max_concurrent_updates)
+        # user id -> [lock, updates holding or waiting for it]
+        self._locks = {}
+
+    async def process_update(self, update, coroutine):
+        # Replaces the base implementation, which takes a slot before do_process_update
+        user = getattr(update, 'effective_user', None)
+        if user is None:
+            async with self._semaphore:
+                await self.do_process_update(update, coroutine)
+            return
+        entry = self._locks.setdefault(user.id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._semaphore:
+                    await self.do_process_update(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[user.id]
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+def build_application(webhook: bool = False) -> Application:
+    """Create a Telegram application without handlers.
+
+    With webhook=True the application has no updater; updates are fed to it
+    by webhook_server.py or a bot_cluster worker instead of long polling.
+    """
+    builder = Application.builder().token(TELEGRAM_BOT_TOKEN)
+    if TELEGRAM_API_BASE_URL:
+        # e.g. a local fake Bot API from fake_telegram.py
+        builder = builder.base_url(f"{TELEGRAM_API_BASE_URL.rstrip('/')}/bot")
+    if webhook:
+        builder = builder.updater(None)
+    builder = builder.concurrent_updates(UserOrderedUpdateProcessor(BOT_CONCURRENT_UPDATES))
+    return builder.build()
+
+def setup_bot(webhook: bool = False):
     """Setup and configure the Telegram bot"""
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    application = build_application(webhook)
     
     bot = ITMOBot()
+    # Learn from the logged conversations before the first question arrives
+    bot.ai_service.relevance.retrain_in_background()
     
     # Add handlers
     application.add_handler(CommandHandler("start", bot.start))
@@ -377,3 +507,5 @@ def run_bot(application):
         application.run_polling(allowed_updates=Update.ALL_TYPES)
     except Exception as e:
         logger.error(f"Error running bot: {e}")
+    finally:
+        conversation_logger.stop()
@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+
+# The bot modules read their configuration at import time
+DB_PATH = os.path.join(tempfile.gettempdir(), f"itmo_bot_tests_{os.getpid()}.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ.setdefault("OPENAI_API_KEY", "tests")
+os.environ["METRICS_DIR"] = ""
+os.environ["STARTUP_REFRESH"] = "off"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if os.path.exists(DB_PATH):
+        os.remove(DB_PATH)
@@ -0,0 +1,36 @@
+from sqlalchemy.exc import IntegrityError
+
+from app import app, db
+from models import PageSnapshot, Program
+import page_store
+import db_migrations
+
+URL = "https://abit.itmo.ru/program/master/legacy"
+
+
+def test_concurrent_page_content_migration_is_a_no_op(monkeypatch, tmp_path):
+    monkeypatch.setattr(db_migrations, 'MIGRATION_LOCK_FILE', str(tmp_path / "migration.lock"))
+    migrate_inline_content = page_store.migrate_inline_content
+    calls = []
+
+    def lose_the_race():
+        calls.append(1)
+        if len(calls) == 1:
+            # Another host moves the pages first; our insert then hits the unique constraint
+            migrate_inline_content()
+            raise IntegrityError("INSERT INTO page_snapshot", {}, Exception("uq_page_snapshot_program_hash"))
+        return migrate_inline_content()
+
+    monkeypatch.setattr(page_store, 'migrate_inline_content', lose_the_race)
+    with app.app_context():
+        Program.query.filter_by(url=URL).delete()
+        program = Program(name="Legacy", url=URL, curriculum_data={'raw_content': "Текст страницы"})
+        db.session.add(program)
+        db.session.commit()
+
+        db_migrations.upgrade_schema()
+
+        assert len(calls) == 2
+        program = Program.query.filter_by(url=URL).one()
+        assert set(program.curriculum_data) == {'fetch_state', 'content_hash'}
+        assert PageSnapshot.query.filter_by(program_id=program.id).count() == 1
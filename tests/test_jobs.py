@@ -0,0 +1,76 @@
+import time
+import fcntl
+import threading
+from datetime import datetime, timedelta
+
+from app import app, db
+from models import RefreshJob
+import jobs
+
+
+def wait_for(refresh_jobs: jobs.RefreshJobQueue, job_id: str) -> dict:
+    deadline = time.monotonic() + 5
+    while refresh_jobs.get(job_id)['status'] in jobs.ACTIVE_JOB_STATUSES and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return refresh_jobs.get(job_id)
+
+
+def clear_jobs(monkeypatch):
+    # Refreshes in these tests only run the (faked) scrape
+    monkeypatch.setattr(jobs, 'RECOMMENDATION_MATRIX_ON_REFRESH', False)
+    with app.app_context():
+        RefreshJob.query.delete()
+        db.session.commit()
+
+
+def test_refresh_job_is_skipped_while_another_process_holds_the_lock(monkeypatch, tmp_path):
+    clear_jobs(monkeypatch)
+    lock_path = tmp_path / "refresh.lock"
+    monkeypatch.setattr(jobs, 'REFRESH_LOCK_FILE', str(lock_path))
+    monkeypatch.setattr(jobs, 'scrape_and_store_program_data', lambda: {'updated': 1})
+
+    refresh_jobs = jobs.RefreshJobQueue()
+    with open(lock_path, "a+") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        job = wait_for(refresh_jobs, refresh_jobs.enqueue()['id'])
+
+    assert job['status'] == 'skipped'
+    assert job['result'] == {'skipped': 'locked'}
+    assert refresh_jobs.status()['last_run']['status'] == 'skipped'
+
+
+def test_jobs_are_visible_to_other_workers(monkeypatch, tmp_path):
+    clear_jobs(monkeypatch)
+    monkeypatch.setattr(jobs, 'REFRESH_LOCK_FILE', str(tmp_path / "refresh.lock"))
+    release = threading.Event()
+
+    def scrape():
+        release.wait(5)
+        return {'updated': 1}
+
+    monkeypatch.setattr(jobs, 'scrape_and_store_program_data', scrape)
+    # Two web workers, each with its own queue
+    accepting, other = jobs.RefreshJobQueue(), jobs.RefreshJobQueue()
+
+    job = accepting.enqueue()
+    assert other.get(job['id'])['status'] in jobs.ACTIVE_JOB_STATUSES
+    assert other.status()['active_job']['id'] == job['id']
+    # A refresh requested from the other worker joins the active job
+    assert other.enqueue()['id'] == job['id']
+
+    release.set()
+    assert wait_for(other, job['id'])['status'] == 'succeeded'
+    assert other.status()['last_run']['result'] == {'updated': 1}
+
+
+def test_jobs_of_an_exited_process_are_marked_failed(monkeypatch):
+    clear_jobs(monkeypatch)
+    with app.app_context():
+        db.session.add(RefreshJob(id="abandoned", status='running',
+                                  created_at=datetime.utcnow() - timedelta(hours=2)))
+        db.session.commit()
+
+    status = jobs.RefreshJobQueue(timeout=3600).status()
+    assert status['active_job'] is None
+    assert status['last_run']['id'] == "abandoned"
+    assert status['last_run']['status'] == 'failed'
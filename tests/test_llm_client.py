@@ -0,0 +1,173 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from llm_client import LLMClient, CircuitBreaker
+
+
+def make_client(latency: float = 0.0, failure_threshold: int = 5, cooldown: float = 30) -> LLMClient:
+    """LLMClient whose upstream answers "ok" after latency seconds"""
+    async def create(**kwargs):
+        await asyncio.sleep(latency)
+        return SimpleNamespace(usage=None, choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))])
+
+    client = LLMClient()
+    client.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    client.breaker = CircuitBreaker(failure_threshold, cooldown)
+    return client
+
+
+def test_coalesced_timeouts_count_as_one_failure():
+    async def scenario():
+        client = make_client(latency=1.0, failure_threshold=2)
+        results = await asyncio.gather(
+            *(client.complete(timeout=0.05, messages=["same"]) for _ in range(5)),
+            return_exceptions=True
+        )
+        assert all(isinstance(result, asyncio.TimeoutError) for result in results)
+        assert client.upstream_calls == 1
+        # The abandoned upstream call is cancelled and judged once
+        await asyncio.sleep(0)
+        assert client.breaker.failures == 1
+        assert client.breaker.state == 'closed'
+
+        response = await client.complete(messages=["other"])
+        assert response.choices[0].message.content == "ok"
+
+    asyncio.run(scenario())
+
+
+def test_one_failure_per_upstream_call_when_a_waiter_times_out():
+    async def scenario():
+        client = make_client(latency=0.2)
+        impatient = client.complete(timeout=0.05, messages=["same"])
+        patient = client.complete(timeout=1, messages=["same"])
+        results = await asyncio.gather(impatient, patient, return_exceptions=True)
+
+        assert isinstance(results[0], asyncio.TimeoutError)
+        assert results[1].choices[0].message.content == "ok"
+        assert client.breaker.failures == 0
+
+    asyncio.run(scenario())
+
+
+def test_stream_first_token_timeouts_count_once():
+    async def scenario():
+        client = make_client()
+
+        async def create(**kwargs):
+            await asyncio.sleep(1)
+
+        client.client.chat.completions.create = create
+
+        async def consume():
+            async for _ in client.stream(first_token_timeout=0.05, messages=["same"]):
+                pass
+
+        results = await asyncio.gather(*(consume() for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, asyncio.TimeoutError) for result in results)
+        await asyncio.sleep(0)
+        assert client.upstream_calls == 1
+        assert client.breaker.failures == 1
+
+    asyncio.run(scenario())
+
+
+def test_abandoned_probe_reopens_the_circuit():
+    async def scenario():
+        client = make_client(latency=1.0, failure_threshold=1, cooldown=0.05)
+        client.breaker.record_failure()
+        assert not client.breaker.allow()
+        await asyncio.sleep(0.06)
+        assert client.breaker.allow()
+
+        # The probe's only caller goes away, e.g. the Telegram reply failed
+        probe = asyncio.create_task(client.complete(messages=["probe"]))
+        await asyncio.sleep(0.01)
+        assert client.breaker.state == 'half_open'
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert client.breaker.state == 'open'
+        assert not client.breaker.allow()
+
+        # After another cooldown a new probe is let through and closes the circuit
+        await asyncio.sleep(0.06)
+        assert client.breaker.allow()
+        client.client = make_client().client
+        await client.complete(messages=["probe"])
+        assert client.breaker.state == 'closed'
+
+    asyncio.run(scenario())
+
+
+def test_half_open_lets_a_single_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0)
+    breaker.record_failure()
+    assert breaker.acquire()
+    assert breaker.state == 'half_open'
+    assert not breaker.allow()
+    assert not breaker.acquire()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+def test_batch_calls_wait_for_a_slot_outside_their_timeout_and_skip_the_breaker():
+    async def scenario():
+        client = make_client(latency=0.1, failure_threshold=1)
+        client._semaphore = asyncio.Semaphore(2)
+        # Six calls through two slots take 0.3 s, longer than each call's timeout
+        results = await asyncio.gather(
+            *(client.complete(timeout=0.15, batch=True, messages=[f"bucket {i}"]) for i in range(6)),
+            return_exceptions=True
+        )
+        assert all(result.choices[0].message.content == "ok" for result in results)
+
+        results = await asyncio.gather(
+            *(client.complete(timeout=0.05, batch=True, messages=[f"slow {i}"]) for i in range(3)),
+            return_exceptions=True
+        )
+        assert all(isinstance(result, asyncio.TimeoutError) for result in results)
+        assert client.breaker.failures == 0
+        assert client.breaker.allow()
+
+    asyncio.run(scenario())
+
+
+def test_stream_deadline_does_not_cancel_the_consumer():
+    class FakeStream:
+        def __init__(self, deltas):
+            self.deltas = list(deltas)
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            await asyncio.sleep(0)
+            if not self.deltas:
+                raise StopAsyncIteration
+            delta = SimpleNamespace(content=self.deltas.pop(0))
+            return SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=delta)])
+
+        async def close(self):
+            pass
+
+    async def scenario():
+        client = make_client()
+
+        async def create(**kwargs):
+            return FakeStream(["one", "two", "three"])
+
+        client.client.chat.completions.create = create
+        received, edited = [], []
+        with pytest.raises(asyncio.TimeoutError):
+            async for delta in client.stream(timeout=0.1, messages=["same"]):
+                received.append(delta)
+                # e.g. editing the Telegram message outlasts the deadline
+                await asyncio.sleep(0.15)
+                edited.append(delta)
+
+        assert received == edited == ["one"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,136 @@
+import time
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import rate_limit
+from rate_limit import AdmissionQueue, Overloaded, UserRateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Manually advanced replacement for time.monotonic in rate_limit"""
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit, 'time', SimpleNamespace(
+        monotonic=lambda: now[0], perf_counter=time.perf_counter
+    ))
+    return now
+
+
+def test_bucket_allows_a_burst_then_limits(clock):
+    limiter = UserRateLimiter(per_minute=60, burst=2)
+
+    assert limiter.allow("1") and limiter.allow("1")
+    assert not limiter.allow("1")
+    assert limiter.retry_after("1") == pytest.approx(1.0)
+    # Other users have their own bucket
+    assert limiter.allow("2")
+
+
+def test_bucket_refills_with_time_up_to_the_burst(clock):
+    limiter = UserRateLimiter(per_minute=60, burst=2)
+    limiter.allow("1")
+    limiter.allow("1")
+
+    clock[0] += 0.5
+    assert not limiter.allow("1")
+    assert limiter.retry_after("1") == pytest.approx(0.5)
+    clock[0] += 0.5
+    assert limiter.allow("1")
+
+    clock[0] += 100
+    assert limiter.allow("1") and limiter.allow("1")
+    assert not limiter.allow("1")
+
+
+def test_zero_rate_disables_the_limit(clock):
+    limiter = UserRateLimiter(per_minute=0, burst=1)
+    assert all(limiter.allow("1") for _ in range(10))
+    assert limiter.retry_after("1") == 0.0
+
+
+def test_queue_full_is_rejected_immediately():
+    async def scenario():
+        queue = AdmissionQueue(max_active=1, max_queue=1, timeout=5)
+        release = asyncio.Event()
+
+        async def hold():
+            async with queue.admit():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        waiter = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        assert queue.active == 1 and len(queue._waiters) == 1
+
+        started = time.perf_counter()
+        with pytest.raises(Overloaded):
+            async with queue.admit():
+                pass
+        assert time.perf_counter() - started < 0.1
+
+        release.set()
+        await asyncio.gather(holder, waiter)
+        assert queue.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_wait_for_a_slot_times_out():
+    async def scenario():
+        queue = AdmissionQueue(max_active=1, max_queue=10, timeout=0.05)
+        release = asyncio.Event()
+
+        async def hold():
+            async with queue.admit():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            async with queue.admit():
+                pass
+        assert not queue._waiters
+
+        release.set()
+        await holder
+        assert queue.active == 0
+        # The slot freed by the holder is not lost to the timed-out waiter
+        async with queue.admit():
+            assert queue.active == 1
+
+    asyncio.run(scenario())
+
+
+def test_slots_are_handed_over_in_arrival_order():
+    async def scenario():
+        queue = AdmissionQueue(max_active=1, max_queue=10, timeout=5)
+        release = asyncio.Event()
+        order = []
+
+        async def hold():
+            async with queue.admit():
+                await release.wait()
+
+        async def wait_in_line(name: str):
+            async with queue.admit():
+                order.append(name)
+                await asyncio.sleep(0)
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiters = []
+        for name in ["first", "second", "third"]:
+            waiters.append(asyncio.create_task(wait_in_line(name)))
+            await asyncio.sleep(0)
+        release.set()
+        await holder
+        # The released slot went to the first waiter, so a newcomer queues behind the others
+        waiters.append(asyncio.create_task(wait_in_line("late")))
+
+        await asyncio.gather(*waiters)
+        assert order == ["first", "second", "third", "late"]
+        assert queue.active == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,44 @@
+import time
+import threading
+
+from app import app, db
+from models import Conversation
+from relevance import RelevanceClassifier, SEED_EXAMPLES
+
+MARKER = "🤔 Не по теме"
+GATED_REPLY = f"\n{MARKER}\n\nСпросите о программах.\n"
+
+
+def make_classifier() -> RelevanceClassifier:
+    return RelevanceClassifier(off_topic_marker=MARKER, gated_reply=GATED_REPLY)
+
+
+def test_training_does_not_block_the_caller(monkeypatch):
+    classifier = make_classifier()
+    trained = threading.Event()
+
+    def slow_training(*args, **kwargs):
+        time.sleep(0.5)
+        trained.set()
+
+    monkeypatch.setattr(classifier, 'train_from_history', slow_training)
+
+    started = time.perf_counter()
+    classifier.is_relevant("Посоветуй фильм на вечер")
+    assert time.perf_counter() - started < 0.2
+    assert trained.wait(2)
+
+
+def test_gate_rejections_are_not_learned():
+    with app.app_context():
+        db.session.query(Conversation).delete()
+        db.session.add_all([
+            # Rejected by the gate itself: must not become a negative
+            Conversation(telegram_user_id="1", message="Где проходят лекции по выходным", response=GATED_REPLY),
+            # Refused by the LLM: a genuine negative
+            Conversation(telegram_user_id="1", message="Посоветуй сериал", response=f"{MARKER}. Я отвечаю о программах."),
+            Conversation(telegram_user_id="1", message="Где проходят лекции", response="В корпусе на Кронверкском."),
+        ])
+        db.session.commit()
+
+        assert make_classifier().train_from_history() == len(SEED_EXAMPLES) + 2
@@ -0,0 +1,76 @@
+import time
+import socket
+import asyncio
+from aiohttp import web
+from telegram import Update
+from telegram.ext import TypeHandler
+
+import telegram_bot
+from fake_telegram import FakeBotAPI, make_text_update
+
+HANDLER_SECONDS = 0.3
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def run_updates(monkeypatch, updates: list, concurrency: int = 32) -> list:
+    """Feed updates through the application's update queue; returns (text, started, finished)"""
+    monkeypatch.setattr(telegram_bot, 'BOT_CONCURRENT_UPDATES', concurrency)
+    port = free_port()
+    runner = web.AppRunner(FakeBotAPI().create_app())
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    monkeypatch.setattr(telegram_bot, 'TELEGRAM_API_BASE_URL', f"http://127.0.0.1:{port}")
+
+    timings = []
+
+    async def handler(update: Update, context):
+        started = time.perf_counter()
+        await asyncio.sleep(HANDLER_SECONDS)
+        timings.append((update.message.text, started, time.perf_counter()))
+
+    application = telegram_bot.build_application(webhook=True)
+    application.add_handler(TypeHandler(Update, handler))
+    try:
+        async with application:
+            await application.start()
+            for update_data in updates:
+                await application.update_queue.put(Update.de_json(update_data, application.bot))
+            await asyncio.wait_for(application.update_queue.join(), 10)
+            await application.stop()
+    finally:
+        await runner.cleanup()
+    return timings
+
+
+def test_different_users_are_handled_concurrently(monkeypatch):
+    timings = asyncio.run(run_updates(monkeypatch, [
+        make_text_update(1, "first user"),
+        make_text_update(2, "second user"),
+    ]))
+
+    assert len(timings) == 2
+    (_, first_started, first_finished), (_, second_started, second_finished) = timings
+    assert first_started < second_finished and second_started < first_finished
+
+
+def test_one_users_updates_keep_their_order(monkeypatch):
+    texts = ["one", "two", "three"]
+    timings = asyncio.run(run_updates(monkeypatch, [make_text_update(1, text) for text in texts]))
+
+    assert [text for text, _, _ in timings] == texts
+    for (_, _, previous_finished), (_, started, _) in zip(timings, timings[1:]):
+        assert started >= previous_finished
+
+
+def test_one_users_burst_does_not_hold_the_slots_of_others(monkeypatch):
+    burst = [make_text_update(1, f"burst {i}") for i in range(5)]
+    timings = asyncio.run(run_updates(monkeypatch, burst + [make_text_update(2, "other user")], concurrency=2))
+
+    finished = {text: finished for text, _, finished in timings}
+    # The other user gets the free slot instead of queueing behind the whole burst
+    assert finished["other user"] < finished["burst 1"]
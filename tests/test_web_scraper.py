@@ -0,0 +1,68 @@
+import re
+from types import SimpleNamespace
+
+from app import app, db
+from models import Program
+import web_scraper
+
+URL = "https://abit.itmo.ru/program/master/test"
+PAGE_TEXT = "Длительность: 2 года\nЯзык обучения: русский\nСтоимость 599 000 ₽"
+
+
+def scrape(monkeypatch, responses: list, requests: list) -> dict:
+    def fetch_page(url, etag=None, last_modified=None):
+        requests.append(etag)
+        return responses.pop(0)
+
+    monkeypatch.setattr(web_scraper, 'fetch_page', fetch_page)
+    return web_scraper.scrape_and_store_program_data()
+
+
+def page(html: str, etag: str) -> dict:
+    return {'status': 200, 'html': html.encode(), 'etag': etag, 'last_modified': None}
+
+
+def test_unchanged_pages_keep_the_catalog_version_and_store_new_validators(monkeypatch):
+    monkeypatch.setattr(web_scraper, 'load_program_list', lambda: [{'name': "Тест", 'url': URL}])
+    monkeypatch.setattr(web_scraper, 'trafilatura', SimpleNamespace(
+        extract=lambda html: re.sub(r'<[^>]+>', '', html.decode())
+    ))
+    requests = []
+    with app.app_context():
+        Program.query.filter_by(url=URL).delete()
+        db.session.commit()
+
+        assert scrape(monkeypatch, [page(f"<p>{PAGE_TEXT}</p>", "v1")], requests)['updated'] == 1
+        updated_at = Program.query.filter_by(url=URL).one().updated_at
+
+        # Same bytes with a new ETag, then new markup around the same text
+        assert scrape(monkeypatch, [page(f"<p>{PAGE_TEXT}</p>", "v2")], requests)['unchanged'] == 1
+        assert scrape(monkeypatch, [page(f"<div>{PAGE_TEXT}</div>", "v3")], requests)['unchanged'] == 1
+        scrape(monkeypatch, [{'status': 304, 'html': None, 'etag': "v3", 'last_modified': None}], requests)
+
+        program = Program.query.filter_by(url=URL).one()
+        assert requests == [None, "v1", "v2", "v3"]
+        assert program.curriculum_data['fetch_state']['etag'] == "v3"
+        assert program.updated_at == updated_at
+
+
+def test_renaming_an_unchanged_program_reloads_the_catalog(monkeypatch):
+    from catalog import program_catalog
+
+    names = ["Старое название"]
+    monkeypatch.setattr(web_scraper, 'load_program_list', lambda: [{'name': names[0], 'url': URL}])
+    monkeypatch.setattr(web_scraper, 'trafilatura', SimpleNamespace(
+        extract=lambda html: re.sub(r'<[^>]+>', '', html.decode())
+    ))
+    requests = []
+    with app.app_context():
+        Program.query.filter_by(url=URL).delete()
+        db.session.commit()
+        scrape(monkeypatch, [page(f"<p>{PAGE_TEXT}</p>", "v1")], requests)
+        assert names[0] in [program.name for program in program_catalog.get().programs]
+
+        names[0] = "Новое название"
+        summary = scrape(monkeypatch, [{'status': 304, 'html': None, 'etag': "v1", 'last_modified': None}], requests)
+
+        assert summary['unchanged'] == 1
+        assert "Новое название" in [program.name for program in program_catalog.get().programs]
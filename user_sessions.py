@@ -0,0 +1,138 @@
+import os
+import logging
+from collections import OrderedDict, deque
+from types import SimpleNamespace
+from app import db
+from models import UserProfile, Conversation
+from metrics import metrics, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Number of user sessions kept in memory and conversation turns per session
+SESSION_CACHE_SIZE = int(os.environ.get("SESSION_CACHE_SIZE", "10000"))
+SESSION_HISTORY_TURNS = 5
+
+PROFILE_FIELDS = (
+    'telegram_user_id', 'username', 'background', 'experience_years', 'interests',
+    'preferred_language', 'survey_step', 'education_background', 'work_experience',
+    'career_goals'
+)
+
+SESSION_LOOKUPS = metrics.counter("session_cache_lookups_total", "User session lookups by result (hit or miss)")
+
+
+class UserSession:
+    """In-memory state of one user: profile snapshot and recent turns"""
+
+    def __init__(self, user_id: str, profile, recent_turns: list):
+        self.user_id = user_id
+        # Snapshot with the same attributes as UserProfile, or None if the
+        # user has no profile yet
+        self.profile = profile
+        # Newest turn first, like the Conversation query it replaces
+        self.recent_turns = deque(recent_turns, maxlen=SESSION_HISTORY_TURNS)
+
+
+class SessionStore:
+    """LRU cache of user sessions with write-through profile updates.
+
+    A cached session answers profile and history lookups without touching
+    the database; profile changes are written to the database immediately.
+    Used from the bot's event loop only, so it does no locking.
+    """
+
+    def __init__(self, capacity: int = SESSION_CACHE_SIZE):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._sessions = OrderedDict()
+
+    def get(self, user_id: str, create: bool = True) -> UserSession:
+        """Return the user's session, loading it (and creating the profile) on a miss"""
+        user_id = str(user_id)
+        session = self._sessions.get(user_id)
+        if session is None:
+            self.misses += 1
+            SESSION_LOOKUPS.inc(result='miss')
+            session = self._load(user_id)
+            self._store(session)
+        else:
+            self.hits += 1
+            SESSION_LOOKUPS.inc(result='hit')
+            self._sessions.move_to_end(user_id)
+
+        if session.profile is None and create:
+            session.profile = self._create_profile(user_id)
+        return session
+
+    def update_profile(self, user_id: str, **fields) -> SimpleNamespace:
+        """Apply profile changes to the session and write them to the database"""
+        session = self.get(user_id)
+        try:
+            UserProfile.query.filter_by(telegram_user_id=session.user_id).update(fields)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self.evict(session.user_id)
+            raise
+        for field, value in fields.items():
+            setattr(session.profile, field, value)
+        return session.profile
+
+    def add_turn(self, user_id: str, message: str, response: str):
+        """Record a conversation turn in the cached session, if any"""
+        session = self._sessions.get(str(user_id))
+        if session is not None:
+            session.recent_turns.appendleft(SimpleNamespace(message=message, response=response))
+
+    def evict(self, user_id: str):
+        self._sessions.pop(str(user_id), None)
+
+    def clear(self):
+        self._sessions.clear()
+
+    def _store(self, session: UserSession):
+        self._sessions[session.user_id] = session
+        while len(self._sessions) > self.capacity:
+            self._sessions.popitem(last=False)
+
+    def _load(self, user_id: str) -> UserSession:
+        with STAGE_SECONDS.time(stage='profile_lookup'):
+            profile = UserProfile.query.filter_by(telegram_user_id=user_id).first()
+        with STAGE_SECONDS.time(stage='history_query'):
+            recent_conversations = Conversation.query.filter_by(
+                telegram_user_id=user_id
+            ).order_by(Conversation.created_at.desc()).limit(SESSION_HISTORY_TURNS).all()
+
+        session = UserSession(
+            user_id,
+            self._snapshot(profile) if profile else None,
+            [SimpleNamespace(message=conv.message, response=conv.response) for conv in recent_conversations]
+        )
+        # End the read transaction so the connection is not kept checked out
+        # while the caller awaits Telegram or the LLM
+        db.session.commit()
+        return session
+
+    def _create_profile(self, user_id: str) -> SimpleNamespace:
+        with STAGE_SECONDS.time(stage='profile_create'):
+            return self._insert_profile(user_id)
+
+    def _insert_profile(self, user_id: str) -> SimpleNamespace:
+        profile = UserProfile()
+        profile.telegram_user_id = user_id
+        profile.survey_step = 0
+        profile.preferred_language = 'ru'
+        db.session.add(profile)
+        # Snapshot before commit: reading expired attributes afterwards would
+        # start a new transaction and keep a connection checked out
+        snapshot = self._snapshot(profile)
+        db.session.commit()
+        return snapshot
+
+    @staticmethod
+    def _snapshot(profile: UserProfile) -> SimpleNamespace:
+        return SimpleNamespace(**{field: getattr(profile, field) for field in PROFILE_FIELDS})
+
+
+session_store = SessionStore()
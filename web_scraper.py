@@ -1,11 +1,93 @@
-import trafilatura
+import os
 import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.error import HTTPError
+from urllib.parse import urlparse
+from urllib.request import Request, urlopen
+import trafilatura
 from models import Program
 from app import db
-import logging
+from catalog import program_catalog
+from retrieval import chunk_text
+from page_store import store_snapshot
+from metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+# JSON file with the programs to scrape: [{"name": ..., "url": ...}, ...]
+PROGRAMS_FILE = os.environ.get("PROGRAMS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "programs.json"))
+SCRAPER_MAX_WORKERS = int(os.environ.get("SCRAPER_MAX_WORKERS", "8"))
+# Concurrent requests allowed against a single host
+SCRAPER_PER_HOST_LIMIT = int(os.environ.get("SCRAPER_PER_HOST_LIMIT", "2"))
+SCRAPER_TIMEOUT = float(os.environ.get("SCRAPER_TIMEOUT", "30"))
+SCRAPER_USER_AGENT = "Mozilla/5.0 (compatible; ITMO-AI-Bot/1.0)"
+
+SCRAPE_STAGE_SECONDS = metrics.histogram(
+    "scrape_stage_seconds", "Time per program page in each scrape stage (fetch, extract, parse, store)"
+)
+SCRAPE_RUN_SECONDS = metrics.histogram("scrape_run_seconds", "Duration of a full program data scrape")
+SCRAPE_PAGES = metrics.counter("scrape_pages_total", "Scraped program pages by result (updated, unchanged or failed)")
+
+DEFAULT_PROGRAMS = [
+    {
+        'name': 'Искусственный интеллект',
+        'url': 'https://abit.itmo.ru/program/master/ai'
+    },
+    {
+        'name': 'Управление ИИ-продуктами/AI Product',
+        'url': 'https://abit.itmo.ru/program/master/ai_product'
+    }
+]
+
+# Section headings as they appear on program pages -> section key
+SECTION_HEADINGS = {
+    'о программе': 'about',
+    'партнеры программы': 'partners',
+    'партнеры': 'partners',
+    'команда программы': 'team',
+    'команда': 'team',
+    'учебный план': 'curriculum',
+    'карьера': 'career',
+    'ты сможешь работать': 'positions',
+    'отзывы': 'reviews',
+    'как поступить': 'admission',
+    'стоимость обучения': 'cost',
+    'стипендии': 'scholarships',
+    'общежитие': 'dormitory',
+    'часто задаваемые вопросы': 'faq',
+    'контакты': 'contacts',
+}
+# Section key -> field filled with the section text
+SECTION_FIELDS = {
+    'about': 'description',
+    'career': 'career_prospects',
+    'admission': 'admission_requirements',
+}
+MAX_LIST_ITEMS = 50
+
+# Longer headings first so "партнеры программы" wins over "партнеры"
+_HEADING_RE = re.compile(
+    r'^[ \t#*]*(?P<heading>' + '|'.join(
+        re.escape(heading).replace('е', '[её]') for heading in sorted(SECTION_HEADINGS, key=len, reverse=True)
+    ) + r')\b[ \t:.!?]*$\n?',
+    re.IGNORECASE | re.MULTILINE
+)
+_DURATION_RE = re.compile(r'длительность[:\s]*(\d+\s*год[а-я]*)', re.IGNORECASE)
+_LANGUAGE_RE = re.compile(r'язык обучения[:\s]*([а-я]+)', re.IGNORECASE)
+_COST_RE = re.compile(r'(\d+\s*\d+\s*₽)')
+_BUDGET_RE = re.compile(r'(\d+)\s*бюджетных')
+_CONTRACT_RE = re.compile(r'(\d+)\s*контрактных')
+_BULLET_RE = re.compile(r'^[\s\-–—•*·]+')
+_PERSON_NAME_RE = re.compile(r'^[А-ЯЁ][а-яё]+(?:-[А-ЯЁ][а-яё]+)?(?:\s+[А-ЯЁ][а-яё]+){1,2}$')
+
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+
 def get_website_text_content(url: str) -> str:
     """
     Extract main text content from a website using trafilatura
@@ -20,6 +102,52 @@ def get_website_text_content(url: str) -> str:
         logger.error(f"Error scraping {url}: {e}")
         return ""
 
+def split_sections(content: str) -> list:
+    """
+    Split page text into (heading, body) pairs in one pass over the text.
+    heading is the canonical section key, or '' for text before the first
+    known heading
+    """
+    sections = []
+    heading = ''
+    start = 0
+    for match in _HEADING_RE.finditer(content):
+        sections.append((heading, content[start:match.start()].strip()))
+        heading = SECTION_HEADINGS[match.group('heading').lower().replace('ё', 'е')]
+        start = match.end()
+    sections.append((heading, content[start:].strip()))
+    return sections
+
+def _section_lines(text: str) -> list:
+    lines = []
+    for line in text.splitlines():
+        line = _BULLET_RE.sub('', line).strip()
+        if line:
+            lines.append(line)
+    return lines
+
+def _parse_partners(text: str) -> list:
+    partners = []
+    for line in _section_lines(text):
+        # Partner blocks are lists of company names, not sentences
+        if len(line) > 80 or line.endswith('.') or line in partners:
+            continue
+        partners.append(line)
+    return partners[:MAX_LIST_ITEMS]
+
+def _parse_team(text: str) -> list:
+    members = []
+    lines = _section_lines(text)
+    for i, line in enumerate(lines):
+        if not _PERSON_NAME_RE.match(line):
+            continue
+        # The line after a name is usually the position, unless it is another name
+        role = ''
+        if i + 1 < len(lines) and not _PERSON_NAME_RE.match(lines[i + 1]):
+            role = lines[i + 1]
+        members.append({'name': line, 'role': role})
+    return members[:MAX_LIST_ITEMS]
+
 def parse_program_data(content: str, url: str) -> dict:
     """
     Parse program information from scraped content
@@ -38,111 +166,236 @@ def parse_program_data(content: str, url: str) -> dict:
     }
     
     # Extract basic program info
-    if 'длительность' in content.lower():
-        duration_match = re.search(r'длительность[:\s]*(\d+\s*год[а-я]*)', content, re.IGNORECASE)
-        if duration_match:
-            data['duration'] = duration_match.group(1)
+    duration_match = _DURATION_RE.search(content)
+    if duration_match:
+        data['duration'] = duration_match.group(1)
     
-    if 'язык обучения' in content.lower():
-        lang_match = re.search(r'язык обучения[:\s]*([а-я]+)', content, re.IGNORECASE)
-        if lang_match:
-            data['language'] = lang_match.group(1)
+    lang_match = _LANGUAGE_RE.search(content)
+    if lang_match:
+        data['language'] = lang_match.group(1)
     
     # Extract cost information
-    cost_match = re.search(r'(\d+\s*\d+\s*₽)', content)
+    cost_match = _COST_RE.search(content)
     if cost_match:
         data['cost'] = cost_match.group(1)
     
     # Extract budget and contract places
-    budget_match = re.search(r'(\d+)\s*бюджетных', content)
+    budget_match = _BUDGET_RE.search(content)
     if budget_match:
         data['budget_places'] = int(budget_match.group(1))
     
-    contract_match = re.search(r'(\d+)\s*контрактных', content)
+    contract_match = _CONTRACT_RE.search(content)
     if contract_match:
         data['contract_places'] = int(contract_match.group(1))
     
-    # Extract program description (text after "о программе")
-    desc_match = re.search(r'о программе.*?(?=партнеры программы|команда|учебный план)', content, re.IGNORECASE | re.DOTALL)
-    if desc_match:
-        data['description'] = desc_match.group(0).replace('о программе', '').strip()
-    
-    # Extract career information
-    career_match = re.search(r'карьера.*?(?=ты сможешь работать|партнеры|отзывы)', content, re.IGNORECASE | re.DOTALL)
-    if career_match:
-        data['career_prospects'] = career_match.group(0).replace('карьера', '').strip()
-    
-    # Extract admission requirements
-    admission_match = re.search(r'как поступить.*?(?=$)', content, re.IGNORECASE | re.DOTALL)
-    if admission_match:
-        data['admission_requirements'] = admission_match.group(0).replace('как поступить', '').strip()
+    # Text sections; the first occurrence of a heading wins
+    for heading, body in split_sections(content):
+        if not heading or not body:
+            continue
+        if heading == 'partners':
+            data['partners'] = data['partners'] or _parse_partners(body)
+        elif heading == 'team':
+            data['team_members'] = data['team_members'] or _parse_team(body)
+        elif heading in SECTION_FIELDS and not data[SECTION_FIELDS[heading]]:
+            data[SECTION_FIELDS[heading]] = body
     
     return data
 
-def scrape_and_store_program_data():
+def load_program_list() -> list:
     """
-    Scrape data from both ITMO AI program pages and store in database
+    Load the list of programs to scrape from PROGRAMS_FILE (JSON list of
+    {"name": ..., "url": ...}), falling back to the built-in defaults
     """
-    programs = [
-        {
-            'name': 'Искусственный интеллект',
-            'url': 'https://abit.itmo.ru/program/master/ai'
-        },
-        {
-            'name': 'Управление ИИ-продуктами/AI Product',
-            'url': 'https://abit.itmo.ru/program/master/ai_product'
-        }
-    ]
+    if os.path.exists(PROGRAMS_FILE):
+        try:
+            with open(PROGRAMS_FILE, encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Error reading program list {PROGRAMS_FILE}: {e}")
+    return DEFAULT_PROGRAMS
+
+def _host_semaphore(url: str) -> threading.Semaphore:
+    host = urlparse(url).netloc
+    with _host_semaphores_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.Semaphore(SCRAPER_PER_HOST_LIMIT)
+        return _host_semaphores[host]
+
+def fetch_page(url: str, etag: str = None, last_modified: str = None) -> dict:
+    """
+    Conditionally download a page. Returns a dict with 'status' (200 or 304),
+    'html' (bytes or None) and the response 'etag' / 'last_modified' validators
+    """
+    headers = {'User-Agent': SCRAPER_USER_AGENT}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
     
-    for program_info in programs:
+    with _host_semaphore(url):
         try:
+            with urlopen(Request(url, headers=headers), timeout=SCRAPER_TIMEOUT) as response:
+                return {
+                    'status': response.status,
+                    'html': response.read(),
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified')
+                }
+        except HTTPError as e:
+            if e.code == 304:
+                return {'status': 304, 'html': None, 'etag': etag, 'last_modified': last_modified}
+            raise
+
+def _scrape_program(program_info: dict, fetch_state: dict) -> dict:
+    """
+    Fetch and, if the page changed, extract and parse one program page.
+    Runs in a worker thread and does not touch the database.
+    """
+    with SCRAPE_STAGE_SECONDS.time(stage='fetch'):
+        page = fetch_page(program_info['url'], fetch_state.get('etag'), fetch_state.get('last_modified'))
+    result = {
+        'program_info': program_info,
+        'changed': False,
+        'fetch_state': {
+            'etag': page['etag'],
+            'last_modified': page['last_modified'],
+            'html_hash': fetch_state.get('html_hash')
+        }
+    }
+    if page['status'] == 304:
+        return result
+    
+    html_hash = hashlib.sha256(page['html']).hexdigest()
+    result['fetch_state']['html_hash'] = html_hash
+    if html_hash == fetch_state.get('html_hash'):
+        return result
+    
+    with SCRAPE_STAGE_SECONDS.time(stage='extract'):
+        content = trafilatura.extract(page['html']) or ""
+    if not content:
+        raise ValueError("no text extracted")
+    
+    result['changed'] = True
+    result['content'] = content
+    with SCRAPE_STAGE_SECONDS.time(stage='parse'):
+        result['chunks'] = chunk_text(content)
+        result['parsed_data'] = parse_program_data(content, program_info['url'])
+    return result
+
+def _store_fetch_state(program, fetch_state: dict):
+    """Save new conditional-request validators of an unchanged page.
+
+    Program.updated_at is the catalog version, so it is kept as is: a page
+    that did not change must not invalidate cached answers.
+    """
+    curriculum_data = dict(program.curriculum_data or {})
+    if curriculum_data.get('fetch_state') == fetch_state:
+        return
+    curriculum_data['fetch_state'] = fetch_state
+    db.session.execute(
+        db.update(Program)
+        .where(Program.id == program.id)
+        .values(curriculum_data=curriculum_data, updated_at=Program.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+
+def _store_program(existing_program, result: dict) -> bool:
+    """Write a scraped program into the session (caller commits).
+
+    Returns False if the page text and the parsed fields are the same as
+    stored; then only the fetch validators are saved.
+    """
+    program_info = result['program_info']
+    parsed_data = result['parsed_data']
+    
+    program = existing_program or Program()
+    program.name = program_info['name']
+    program.url = program_info['url']
+    program.description = parsed_data['description']
+    program.duration = parsed_data['duration']
+    program.language = parsed_data['language']
+    program.cost = parsed_data['cost']
+    program.budget_places = parsed_data['budget_places']
+    program.contract_places = parsed_data['contract_places']
+    program.career_prospects = parsed_data['career_prospects']
+    program.admission_requirements = parsed_data['admission_requirements']
+    program.partners = parsed_data['partners']
+    program.team_members = parsed_data['team_members']
+    if existing_program is None:
+        db.session.add(program)
+        db.session.flush()
+    
+    # Page text goes to a compressed snapshot; the row only references it
+    content_hash = store_snapshot(program.id, program.url, result['content'], result['chunks'])
+    if (existing_program is not None and not db.session.is_modified(program)
+            and (program.curriculum_data or {}).get('content_hash') == content_hash):
+        _store_fetch_state(program, result['fetch_state'])
+        return False
+    program.curriculum_data = {'fetch_state': result['fetch_state'], 'content_hash': content_hash}
+    return True
+
+def scrape_and_store_program_data() -> dict:
+    """
+    Scrape all configured program pages concurrently and store changed ones
+    in the database. Returns counts of updated, unchanged and failed pages.
+    """
+    started = time.perf_counter()
+    programs = load_program_list()
+    existing = {program.url: program for program in Program.query.filter(
+        Program.url.in_([program_info['url'] for program_info in programs])
+    ).all()}
+    summary = {'updated': 0, 'unchanged': 0, 'failed': 0}
+    # Set when any Program column changed, e.g. a rename of an unchanged page
+    catalog_changed = False
+    
+    with ThreadPoolExecutor(max_workers=SCRAPER_MAX_WORKERS) as executor:
+        futures = {}
+        for program_info in programs:
+            existing_program = existing.get(program_info['url'])
+            fetch_state = {}
+            if existing_program and existing_program.curriculum_data:
+                fetch_state = existing_program.curriculum_data.get('fetch_state') or {}
             logger.info(f"Scraping program: {program_info['name']}")
-            
-            # Check if program already exists
-            existing_program = Program.query.filter_by(url=program_info['url']).first()
-            
-            content = get_website_text_content(program_info['url'])
-            if not content:
-                logger.warning(f"No content scraped for {program_info['url']}")
-                continue
-            
-            parsed_data = parse_program_data(content, program_info['url'])
-            
-            if existing_program:
-                # Update existing program
-                existing_program.name = program_info['name']
-                existing_program.description = parsed_data['description']
-                existing_program.duration = parsed_data['duration']
-                existing_program.language = parsed_data['language']
-                existing_program.cost = parsed_data['cost']
-                existing_program.budget_places = parsed_data['budget_places']
-                existing_program.contract_places = parsed_data['contract_places']
-                existing_program.career_prospects = parsed_data['career_prospects']
-                existing_program.admission_requirements = parsed_data['admission_requirements']
-                existing_program.curriculum_data = {'raw_content': content}
-                existing_program.partners = parsed_data['partners']
-                existing_program.team_members = parsed_data['team_members']
-            else:
-                # Create new program
-                new_program = Program()
-                new_program.name = program_info['name']
-                new_program.url = program_info['url']
-                new_program.description = parsed_data['description']
-                new_program.duration = parsed_data['duration']
-                new_program.language = parsed_data['language']
-                new_program.cost = parsed_data['cost']
-                new_program.budget_places = parsed_data['budget_places']
-                new_program.contract_places = parsed_data['contract_places']
-                new_program.career_prospects = parsed_data['career_prospects']
-                new_program.admission_requirements = parsed_data['admission_requirements']
-                new_program.curriculum_data = {'raw_content': content}
-                new_program.partners = parsed_data['partners']
-                new_program.team_members = parsed_data['team_members']
-                db.session.add(new_program)
-            
-            db.session.commit()
-            logger.info(f"Successfully stored program: {program_info['name']}")
-            
-        except Exception as e:
-            logger.error(f"Error processing program {program_info['name']}: {e}")
-            db.session.rollback()
+            futures[executor.submit(_scrape_program, program_info, fetch_state)] = program_info
+        
+        # Database writes stay on the calling thread
+        for future in as_completed(futures):
+            program_info = futures[future]
+            try:
+                result = future.result()
+                existing_program = existing.get(program_info['url'])
+                
+                if not result['changed']:
+                    summary['unchanged'] += 1
+                    if existing_program:
+                        if existing_program.name != program_info['name']:
+                            existing_program.name = program_info['name']
+                            catalog_changed = True
+                        # The server may send new validators for the same page
+                        _store_fetch_state(existing_program, result['fetch_state'])
+                        db.session.commit()
+                    logger.info(f"Program page unchanged: {program_info['name']}")
+                    continue
+                
+                with SCRAPE_STAGE_SECONDS.time(stage='store'):
+                    updated = _store_program(existing_program, result)
+                    db.session.commit()
+                if not updated:
+                    summary['unchanged'] += 1
+                    logger.info(f"Program page text unchanged: {program_info['name']}")
+                    continue
+                summary['updated'] += 1
+                catalog_changed = True
+                logger.info(f"Successfully stored program: {program_info['name']}")
+                
+            except Exception as e:
+                summary['failed'] += 1
+                logger.error(f"Error processing program {program_info['name']}: {e}")
+                db.session.rollback()
+    
+    if catalog_changed:
+        program_catalog.invalidate()
+    for result, count in summary.items():
+        SCRAPE_PAGES.inc(count, result=result)
+    SCRAPE_RUN_SECONDS.observe(time.perf_counter() - started)
+    return summary
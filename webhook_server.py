@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Run the Telegram bot in webhook mode on an aiohttp server.
+
+Telegram POSTs updates to WEBHOOK_PATH; each request is validated against
+the secret token and handed to the bot's update queue. To use several
+cores, --partitions runs a single front process that hands each update to
+the bot worker that owns its user. Session state and rate limits are kept
+per process, so every user must always be handled by the same process: do
+not run independent instances behind a load balancer. Register the webhook
+once with --set-webhook.
+
+    python webhook_server.py --port 8443
+    python webhook_server.py --port 8443 --partitions 4
+    python webhook_server.py --set-webhook https://bot.example.com/telegram/webhook
+"""
+import os
+import sys
+import asyncio
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiohttp import web
+from telegram import Update
+from app import app
+from conversation_log import conversation_logger
+from telegram_bot import setup_bot
+from bot_cluster import BOT_WORKERS, BotCluster
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/telegram/webhook")
+# Telegram echoes this in X-Telegram-Bot-Api-Secret-Token on every request
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")
+
+def create_webhook_app(application, cluster: BotCluster = None) -> web.Application:
+    """Build the aiohttp app that feeds webhook updates into application,
+    or into the worker processes of cluster when one is given"""
+    async def handle_update(request: web.Request) -> web.Response:
+        if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+
+        if cluster is not None:
+            cluster.dispatch(data)
+        else:
+            update = Update.de_json(data, application.bot)
+            await application.update_queue.put(update)
+        return web.Response(text="ok")
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({'status': 'ok'})
+
+    async def on_startup(_):
+        if cluster is not None:
+            return
+        await application.initialize()
+        await application.start()
+
+    async def on_cleanup(_):
+        if cluster is not None:
+            cluster.stop()
+            return
+        await application.stop()
+        await application.shutdown()
+        conversation_logger.stop()
+
+    webhook_app = web.Application()
+    webhook_app.router.add_post(WEBHOOK_PATH, handle_update)
+    webhook_app.router.add_get("/healthz", health)
+    webhook_app.on_startup.append(on_startup)
+    webhook_app.on_cleanup.append(on_cleanup)
+    return webhook_app
+
+def serve_partitioned(host: str, port: int, partitions: int):
+    """Run one front process that hands updates to bot workers by user"""
+    cluster = BotCluster(partitions)
+    cluster.start()
+    web.run_app(create_webhook_app(None, cluster), host=host, port=port, print=None)
+
+def serve(host: str, port: int):
+    """Run the webhook server and the bot in this process"""
+    with app.app_context():
+        application = setup_bot(webhook=True)
+        web.run_app(create_webhook_app(application), host=host, port=port, print=None)
+
+async def set_webhook(url: str):
+    application = setup_bot(webhook=True)
+    async with application:
+        await application.bot.set_webhook(
+            url,
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=Update.ALL_TYPES
+        )
+    logger.info(f"Webhook registered: {url}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8443")))
+    parser.add_argument("--partitions", type=int, default=BOT_WORKERS,
+                        help="bot worker processes behind a single front process, "
+                             "with each user pinned to one worker (keeps per-user order)")
+    parser.add_argument("--set-webhook", metavar="URL", help="register the public webhook URL and exit")
+    args = parser.parse_args()
+
+    if args.set_webhook:
+        asyncio.run(set_webhook(args.set_webhook))
+        return
+
+    if args.partitions > 1:
+        serve_partitioned(args.host, args.port, args.partitions)
+        return
+
+    serve(args.host, args.port)
+
+if __name__ == "__main__":
+    main()